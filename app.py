@@ -1,18 +1,29 @@
-from flask import Flask, render_template, abort, request, redirect, url_for, flash, g, session, send_from_directory
+from flask import Flask, Blueprint, render_template, abort, request, redirect, url_for, flash, g, session, send_from_directory, has_request_context
 from flask_mail import Mail, Message
 from werkzeug.utils import safe_join 
 import os
+import stat
+import string
 import re 
 import yaml 
-import frontmatter
 from markupsafe import Markup
-import pypandoc 
-from jinja2 import Environment, FileSystemLoader, select_autoescape
-from datetime import datetime 
-import dateparser 
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+from datetime import date, datetime 
 import importlib.util 
+import zipfile
 import sys 
-from collections import defaultdict
+import functools
+import hashlib
+import shutil
+import tempfile
+import json
+import sqlite3
+import threading
+import base64
+import atexit
+import subprocess
+import http.client
+import urllib.parse
 
 # Initialize Flask App
 app = Flask(__name__)
@@ -21,41 +32,91 @@ mail = Mail(app)
 app.secret_key = os.environ.get('FLASK_SECRET_KEY', 'a_default_secret_for_dev_only_shh')
 
 # --- Plugin System ---
-PLUGIN_HOOKS = defaultdict(list)
+# Hook name -> tuple of functions. Registration replaces the tuple rather than
+# mutating it, so a hook that is firing never sees the sequence change under it.
+PLUGIN_HOOKS = {}
+# Hook name -> dispatcher closure built from that tuple, rebuilt on each registration.
+HOOK_DISPATCHERS = {}
 PLUGINS_DIR = os.path.join(app.root_path, 'plugins')
+PLUGINS_ZIP = os.path.join(app.root_path, 'plugins.zip') # Optional archive of plugins/, used instead of the directory
+
+def _build_hook_dispatcher(hook_name, functions):
+    """Returns a function that runs a hook's functions in order, with their log messages prepared once."""
+    calls = tuple((function,
+                   f"Executed hook '{hook_name}' with function {function.__name__}",
+                   f"Error executing hook '{hook_name}' with function {function.__name__}")
+                  for function in functions)
+
+    def dispatch(*args, **kwargs):
+        data_to_modify = args[0] if args else None
+        remaining_args = args[1:]
+        for function, executed_message, error_message in calls:
+            try:
+                if data_to_modify is not None: 
+                    # Pass the kwargs dict through, so plugins can share data
+                    modified_result = function(data_to_modify, *remaining_args, **kwargs)
+                    if modified_result is not None: 
+                        data_to_modify = modified_result
+                else:
+                    # This branch handles hooks that don't modify the first argument
+                    function(*args, **kwargs)
+
+                app.logger.debug(executed_message)
+            except PermissionError: 
+                raise
+            except Exception as e:
+                app.logger.error(f"{error_message}: {e}", exc_info=True)
+        return data_to_modify
+    return dispatch
 
 def register_hook(hook_name, function):
-    PLUGIN_HOOKS[hook_name].append(function)
+    PLUGIN_HOOKS[hook_name] = PLUGIN_HOOKS.get(hook_name, ()) + (function,)
+    HOOK_DISPATCHERS[hook_name] = _build_hook_dispatcher(hook_name, PLUGIN_HOOKS[hook_name])
     app.logger.info(f"Registered function {function.__name__} for hook '{hook_name}'")
 
 def trigger_hook(hook_name, *args, **kwargs):
-    data_to_modify = args[0] if args else None
-    
-    for function in PLUGIN_HOOKS[hook_name]:
+    dispatch = HOOK_DISPATCHERS.get(hook_name)
+    if dispatch is None: return args[0] if args else None
+    return dispatch(*args, **kwargs)
+
+app.trigger_hook = trigger_hook
+
+def _load_plugins_from_zip():
+    """Imports plugins from PLUGINS_ZIP through zipimport, so startup reads one archive instead of
+    walking the plugins directory. Returns False when there is no archive."""
+    if not os.path.isfile(PLUGINS_ZIP): return False
+    with zipfile.ZipFile(PLUGINS_ZIP) as archive:
+        archive_names = archive.namelist()
+    if PLUGINS_ZIP not in sys.path:
+        sys.path.insert(0, PLUGINS_ZIP)
+
+    module_names = []
+    for archive_name in archive_names:
+        parts = archive_name.split('/')
+        if len(parts) < 2 or parts[0] != 'plugins' or parts[1].startswith('_'): continue
+        if len(parts) == 2 and parts[1].endswith('.py'): module_names.append(parts[1][:-3])
+        elif len(parts) == 3 and parts[2] == '__init__.py': module_names.append(parts[1])
+
+    for module_name in module_names:
         try:
-            if data_to_modify is not None and args: 
-                current_args = list(args)
-                current_args[0] = data_to_modify
-                
-                # Pass the kwargs dict through, so plugins can share data
-                modified_result = function(*current_args, **kwargs)
-                if modified_result is not None: 
-                    data_to_modify = modified_result
+            plugin_module = importlib.import_module(f'plugins.{module_name}')
+            # Blueprint template/static folders are relative to the module, which is inside the
+            # archive; resolve them as if the plugin were unpacked in PLUGINS_DIR.
+            for module_attribute in vars(plugin_module).values():
+                if isinstance(module_attribute, Blueprint) and module_attribute.root_path.startswith(PLUGINS_ZIP):
+                    module_attribute.root_path = PLUGINS_DIR
+            if hasattr(plugin_module, 'register'):
+                plugin_module.register(app, register_hook) 
+                app.logger.info(f"Loaded plugin from {PLUGINS_ZIP}: {module_name}")
             else:
-                # This branch handles hooks that don't modify the first argument
-                function(*args, **kwargs)
-
-            app.logger.debug(f"Executed hook '{hook_name}' with function {function.__name__}")
-        except PermissionError: 
-            raise
+                app.logger.warning(f"Plugin {module_name} has no register() function.")
         except Exception as e:
-            app.logger.error(f"Error executing hook '{hook_name}' with function {function.__name__}: {e}", exc_info=True)
-    
-    return data_to_modify
-
-app.trigger_hook = trigger_hook
+            app.logger.error(f"Failed to load plugin {module_name} from {PLUGINS_ZIP}: {e}", exc_info=True)
+    return True
 
 def load_plugins():
+    if _load_plugins_from_zip(): return
+
     if not os.path.exists(PLUGINS_DIR):
         app.logger.info(f"Plugins directory '{PLUGINS_DIR}' not found. Skipping plugin loading.")
         return
@@ -63,10 +124,14 @@ def load_plugins():
     if PLUGINS_DIR not in sys.path:
         sys.path.insert(0, PLUGINS_DIR)
 
-    for item_name in os.listdir(PLUGINS_DIR):
-        item_path = os.path.join(PLUGINS_DIR, item_name)
+    # DirEntry caches the file type from the directory read, saving a stat() per entry.
+    with os.scandir(PLUGINS_DIR) as scanner:
+        plugin_entries = list(scanner)
+
+    for entry in plugin_entries:
+        item_name, item_path = entry.name, entry.path
         
-        if item_name.endswith('.py') and not item_name.startswith('_'):
+        if item_name.endswith('.py') and not item_name.startswith('_') and entry.is_file():
             module_name = item_name[:-3]
             try:
                 spec = importlib.util.spec_from_file_location(module_name, item_path)
@@ -80,7 +145,7 @@ def load_plugins():
             except Exception as e:
                 app.logger.error(f"Failed to load plugin {module_name}: {e}", exc_info=True)
         
-        elif os.path.isdir(item_path) and not item_name.startswith('_') and os.path.exists(os.path.join(item_path, '__init__.py')):
+        elif not item_name.startswith('_') and entry.is_dir() and os.path.exists(os.path.join(item_path, '__init__.py')):
             module_name = item_name
             try:
                 plugin_module = importlib.import_module(module_name)
@@ -96,40 +161,213 @@ def load_plugins():
 load_plugins()
 trigger_hook('app_initialized', app=app) 
 
+# --- Pandoc Conversion ---
+# Spawning a new pandoc process per conversion costs far more than the conversion
+# itself on typical pages, so when a `pandoc server` is configured (or autostarted)
+# conversions are POSTed to it instead. pypandoc remains the fallback.
+PANDOC_SERVER_PROCESS = None
+
+def start_pandoc_server():
+    global PANDOC_SERVER_PROCESS
+    if app.config.get('PANDOC_SERVER_URL') or not app.config.get('PANDOC_SERVER_AUTOSTART'):
+        return
+    port = app.config.get('PANDOC_SERVER_PORT', 3030)
+    timeout = app.config.get('PANDOC_SERVER_TIMEOUT', 30)
+    import pypandoc
+    try:
+        PANDOC_SERVER_PROCESS = subprocess.Popen(
+            [pypandoc.get_pandoc_path(), 'server', f'--port={port}', f'--timeout={timeout}'],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except (OSError, RuntimeError) as e:
+        app.logger.error(f"Could not start pandoc server: {e}")
+        return
+    atexit.register(PANDOC_SERVER_PROCESS.terminate)
+    app.config['PANDOC_SERVER_URL'] = f"http://127.0.0.1:{port}"
+    app.logger.info(f"Started pandoc server (pid {PANDOC_SERVER_PROCESS.pid}) on port {port}")
+
+def _pandoc_server_request(source, to, format, extra_args, resource_files):
+    """Translates pandoc CLI arguments into a pandoc server request body.
+    Returns None if an argument has no server equivalent."""
+    body = {'text': source, 'from': format, 'to': to}
+    files = list(resource_files)
+    for arg in extra_args:
+        name, _, value = arg.lstrip('-').partition('=')
+        if name == 'citeproc':
+            body['citeproc'] = True
+        elif name == 'shift-heading-level-by' and value:
+            body['shift-heading-level-by'] = int(value)
+        elif name == 'bibliography' and value:
+            body.setdefault('bibliography', []).append(value)
+            files.append(value)
+        elif name == 'csl' and value:
+            body['csl'] = value
+            files.append(value)
+        elif name == 'mathjax':
+            body['html-math-method'] = {'method': 'mathjax', 'url': value} if value else {'method': 'mathjax'}
+        else:
+            return None
+    # The server cannot read from disk, so referenced files travel with the request.
+    body['files'] = {}
+    for file_path in files:
+        try:
+            with open(file_path, 'rb') as f:
+                body['files'][file_path] = base64.b64encode(f.read()).decode('ascii')
+        except OSError as e:
+            app.logger.warning(f"Pandoc resource '{file_path}' could not be read: {e}")
+    return body
+
+# orjson serializes straight to UTF-8 bytes; the json module builds a str that then has to be encoded.
+try:
+    import orjson
+    _encode_json_body = orjson.dumps
+except ImportError:
+    def _encode_json_body(body): return json.dumps(body).encode('utf-8')
+
+_pandoc_server_local = threading.local()
+
+def _pandoc_server_connection():
+    """Returns this thread's keep-alive connection to the pandoc server, so requests skip the TCP handshake."""
+    connection = getattr(_pandoc_server_local, 'connection', None)
+    if connection is None:
+        server_url = urllib.parse.urlsplit(app.config['PANDOC_SERVER_URL'])
+        connection_class = http.client.HTTPSConnection if server_url.scheme == 'https' else http.client.HTTPConnection
+        connection = connection_class(server_url.hostname, server_url.port, timeout=app.config.get('PANDOC_SERVER_TIMEOUT', 30))
+        _pandoc_server_local.connection, _pandoc_server_local.path = connection, server_url.path or '/'
+    return connection
+
+def _pandoc_server_convert(body):
+    request_data = _encode_json_body(body)
+    headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+    while True:
+        connection = _pandoc_server_connection()
+        reused_connection = connection.sock is not None
+        try:
+            connection.request('POST', _pandoc_server_local.path, body=request_data, headers=headers)
+            response = connection.getresponse()
+            response_data = response.read()
+            break
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            _pandoc_server_local.connection = None
+            # The server may have closed an idle connection; only a fresh one failing is an error.
+            if not reused_connection: raise
+    if response.status >= 400:
+        raise RuntimeError(f"Pandoc server error: {response_data.decode('utf-8', 'replace')}")
+    result = json.loads(response_data)
+    if 'error' in result:
+        raise RuntimeError(f"Pandoc server error: {result['error']}")
+    output = result.get('output', '')
+    return base64.b64decode(output).decode('utf-8') if result.get('base64') else output
+
+def pandoc_convert(source, to='html5', format='markdown', extra_args=(), resource_files=(), outputfile=None):
+    """Converts text with Pandoc, preferring the pandoc server over a new process.
+    If outputfile is given, the result is also left in that file."""
+    if app.config.get('PANDOC_SERVER_URL'):
+        body = _pandoc_server_request(source, to, format, extra_args, resource_files)
+        if body is None:
+            app.logger.debug(f"Pandoc arguments {extra_args} not supported by pandoc server. Using subprocess.")
+        else:
+            try:
+                output = _pandoc_server_convert(body)
+            except (OSError, http.client.HTTPException) as e:
+                app.logger.warning(f"Pandoc server unavailable ({e}). Falling back to pandoc subprocess.")
+            else:
+                if outputfile:
+                    with open(outputfile, 'w', encoding='utf-8') as f: f.write(output)
+                return output
+    # Same command line pypandoc.convert_text builds, run directly so a hung pandoc is killed after PANDOC_TIMEOUT.
+    import pypandoc
+    timeout = app.config.get('PANDOC_TIMEOUT', 60)
+    args = [pypandoc.get_pandoc_path(), f'--from={format}', f'--to={to}']
+    if outputfile: args.append(f'--output={outputfile}')
+    args.extend(extra_args)
+    try:
+        result = subprocess.run(args, input=source.encode('utf-8'), capture_output=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        raise RuntimeError(f"Pandoc did not finish within {timeout} seconds.")
+    if result.returncode != 0:
+        raise RuntimeError(f'Pandoc died with exitcode "{result.returncode}" during conversion: {result.stderr.decode("utf-8", "replace")}')
+    if not outputfile:
+        return result.stdout.decode('utf-8')
+    with open(outputfile, 'r', encoding='utf-8') as f: return f.read()
+
+start_pandoc_server()
+app.pandoc_convert = pandoc_convert
+
 # --- Custom Jinja2 Filter Definition ---
+def _parse_any_date(value_str):
+    """ISO 8601 dates (the usual frontmatter form) take the C fromisoformat path; anything else goes to dateparser.
+    dateparser results are memoized per request only, since phrases like "now" are relative."""
+    try:
+        return datetime.fromisoformat(value_str)
+    except ValueError:
+        pass
+    request_dates = g.setdefault('_anydate_cache', {}) if has_request_context() else {}
+    if value_str not in request_dates:
+        import dateparser # Loads its locale data on first use rather than at startup
+        request_dates[value_str] = dateparser.parse(value_str)
+    return request_dates[value_str]
+
 def anydate_filter(value, format_string="%B %d, %Y"):
     if not value: return ""
     try:
-        parsed_date = dateparser.parse(str(value))
+        # YAML frontmatter already yields date/datetime objects for unquoted dates.
+        parsed_date = value if isinstance(value, date) else _parse_any_date(str(value))
         return parsed_date.strftime(format_string) if parsed_date else str(value)
     except Exception as e:
         app.logger.error(f"Error in anydate_filter for value '{value}': {e}")
         return str(value)
 
+# Snippets passed through |markdown are rendered in-process with Python-Markdown when
+# it is installed, instead of a Pandoc round trip per value. Instances are not thread-safe.
+try:
+    import markdown as markdown_lib
+except ImportError:
+    markdown_lib = None
+_markdown_local = threading.local()
+
+def _render_markdown_snippet(s):
+    if markdown_lib is None: return pandoc_convert(s, 'html5', format='markdown')
+    renderer = getattr(_markdown_local, 'renderer', None)
+    if renderer is None: renderer = _markdown_local.renderer = markdown_lib.Markdown()
+    return renderer.reset().convert(s)
+
 def markdown_filter(s):
     if not s: return ""
-    html = pypandoc.convert_text(s, 'html5', format='markdown')
-    html = html.replace('<p>', '', 1).replace('</p>', '', 1).strip()
+    html = _render_markdown_snippet(str(s))
+    html = html.strip()
+    # Unwrap a lone paragraph so inline values don't gain block spacing; multi-paragraph output stays intact.
+    if html.startswith('<p>') and html.endswith('</p>') and html.find('<p>', 3) == -1:
+        html = html[3:-4]
     return Markup(html)
 
 def absolutize_internal_links(html_content, page_name=None):
     if not html_content or not page_name: return html_content
     try:
-        base_url = url_for('view_page', page_name=page_name)
-        absolute_html = re.sub(r'href="#', f'href="{base_url}#', html_content)
+        base_url = view_page_url(page_name)
+        absolute_html = html_content.replace('href="#', f'href="{base_url}#')
         return Markup(absolute_html)
     except Exception as e:
         app.logger.error(f"Error in absolutize_internal_links filter: {e}")
         return html_content
 
 # --- Jinja2 Environment for Markdown Templates ---
+# Compiled template bytecode is shared on disk, so each new worker skips compiling the templates again.
+jinja_bytecode_dir = os.path.join(app.config['CACHE_DIR'], 'jinja')
+os.makedirs(jinja_bytecode_dir, exist_ok=True)
+jinja_bytecode_cache = FileSystemBytecodeCache(jinja_bytecode_dir)
+app.jinja_env.bytecode_cache = jinja_bytecode_cache
+
 md_template_dir = os.path.join(app.root_path, 'templates', 'markdown')
 md_jinja_env = Environment(
     loader=FileSystemLoader(md_template_dir),
-    autoescape=select_autoescape(['md']),
+    bytecode_cache=jinja_bytecode_cache,
+    autoescape=False, # Output is Markdown for Pandoc, not HTML; select_autoescape(['md']) never matched .j2md anyway
     trim_blocks=True,
     lstrip_blocks=True
 )
+# Markdown templates only change on deploy; set TEMPLATES_AUTO_RELOAD to pick up edits without a restart.
+md_jinja_env.auto_reload = bool(app.config.get('TEMPLATES_AUTO_RELOAD'))
 md_jinja_env.filters['anydate'] = anydate_filter
 md_jinja_env.filters['markdown'] = markdown_filter
 md_jinja_env.filters['absolutize'] = absolutize_internal_links
@@ -138,40 +376,223 @@ app.jinja_env.filters['markdown'] = markdown_filter
 app.jinja_env.filters['absolutize'] = absolutize_internal_links
 
 # --- Wikilink and Slugify Helper Functions ---
+SLUG_WHITESPACE_RE = re.compile(r'\s+')
+SLUG_INVALID_CHARS_RE = re.compile(r'[^\w\-]')
+
+@functools.lru_cache(maxsize=4096)
 def slugify(text):
     text = str(text).lower()
-    text = re.sub(r'\s+', '-', text) 
-    text = re.sub(r'[^\w\-]', '', text) 
+    if text.isascii(): return _slugify_ascii(text)
+    text = SLUG_WHITESPACE_RE.sub('-', text) 
+    text = SLUG_INVALID_CHARS_RE.sub('', text) 
     return text
 
+# ASCII characters outside [\w-], deleted by one str.translate call.
+SLUG_ASCII_DELETE_TABLE = str.maketrans('', '', ''.join(c for c in map(chr, range(128)) if not (c.isalnum() or c in '_-')))
+
+def _slugify_ascii(text):
+    """Same result as the regex passes in slugify for ASCII input, without entering the regex engine."""
+    words = text.split()
+    slug = '-'.join(words)
+    # split() drops leading/trailing whitespace, where the \s+ substitution leaves a hyphen.
+    if text[:1].isspace(): slug = '-' + slug
+    if words and text[-1].isspace(): slug += '-'
+    return slug.translate(SLUG_ASCII_DELETE_TABLE)
+
+@functools.lru_cache(maxsize=4096)
+def _normalize_page_name(page_name):
+    """Slugifies each path component of a page name, dropping empty ones."""
+    return '/'.join(slugify(part) for part in filter(None, page_name.split('/')))
+
+# Script root -> URL of view_page without the page name. The route never changes at runtime,
+# so page URLs are built by concatenation instead of a URL map lookup per link.
+_VIEW_PAGE_URL_PREFIXES = {}
+
+def view_page_url(page_name_slug):
+    """Same result as url_for('view_page', page_name=...) for slugs."""
+    script_root = request.script_root if has_request_context() else ''
+    prefix = _VIEW_PAGE_URL_PREFIXES.get(script_root)
+    if prefix is None:
+        prefix = _VIEW_PAGE_URL_PREFIXES[script_root] = url_for('view_page', page_name='_')[:-1]
+    return prefix + urllib.parse.quote(page_name_slug, safe='/')
+
+WIKILINK_RE = re.compile(r'\[\[([^\]]+)\]\]')
+
+# Rendered links depend only on the link text (the URL root is fixed per deployment),
+# so the same [[link]] across pages and requests is resolved once.
+@functools.lru_cache(maxsize=8192)
+def _resolve_wikilink(full_link_text):
+    display_text, target_path_str = (full_link_text, full_link_text)
+    if '|' in full_link_text:
+        target_path_str, display_text = map(str.strip, full_link_text.split('|', 1))
+    normalized_path_str = target_path_str.replace(':', '/')
+    path_components = [slugify(comp.strip()) for comp in normalized_path_str.split('/') if comp.strip()]
+    if not path_components: return f'[[{full_link_text}]]' 
+    final_slug = '/'.join(path_components)
+    if '|' not in full_link_text: display_text = directory_elements[-1] if (directory_elements := normalized_path_str.split('/')) else final_slug
+    # Brackets in the text and quotes in the title would otherwise end the link early; url_for already quotes the URL.
+    display_text = display_text.replace('[', '\\[').replace(']', '\\]')
+    link_title = target_path_str.replace(':', ' > ').replace('"', '\\"')
+    return f'[{display_text}]({view_page_url(final_slug)} "{link_title}")'
+
 def convert_wikilinks(markdown_content):
-    def replace_wikilink(match):
-        full_link_text = match.group(1).strip()
-        display_text, target_path_str = (full_link_text, full_link_text)
-        if '|' in full_link_text:
-            target_path_str, display_text = map(str.strip, full_link_text.split('|', 1))
-        normalized_path_str = target_path_str.replace(':', '/')
-        path_components = [slugify(comp.strip()) for comp in normalized_path_str.split('/') if comp.strip()]
-        if not path_components: return f'[[{full_link_text}]]' 
-        final_slug = '/'.join(path_components)
-        if '|' not in full_link_text: display_text = directory_elements[-1] if (directory_elements := normalized_path_str.split('/')) else final_slug
-        return f'[{display_text}]({url_for("view_page", page_name=final_slug)} "{target_path_str.replace(":", " > ")}")'
-    return re.sub(r'\[\[([^\]]+)\]\]', replace_wikilink, markdown_content)
+    if '[[' not in markdown_content: return markdown_content # Substring search is far cheaper than a regex scan
+    # Slices and a single join rather than re.sub with a per-match callback.
+    pieces, last_end = [], 0
+    for match in WIKILINK_RE.finditer(markdown_content):
+        start, end = match.span()
+        pieces.append(markdown_content[last_end:start])
+        pieces.append(_resolve_wikilink(match.group(1).strip()))
+        last_end = end
+    if not pieces: return markdown_content
+    pieces.append(markdown_content[last_end:])
+    return ''.join(pieces)
+
+FRONTMATTER_BOUNDARY_RE = re.compile(r'^-{3,}\s*$', re.MULTILINE)
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader) # libyaml-backed when PyYAML was built with it
+
+def split_frontmatter(text):
+    """Splits a Markdown document into its raw YAML frontmatter text and body, as python-frontmatter does."""
+    text = text.strip()
+    if not text.startswith('---'): return '', text
+    parts = FRONTMATTER_BOUNDARY_RE.split(text, 2)
+    if len(parts) < 3: return '', text
+    return parts[1], parts[2].strip()
+
+def parse_frontmatter_yaml(yaml_text):
+    metadata = yaml.load(yaml_text, Loader=YAML_LOADER) if yaml_text.strip() else None
+    return metadata if isinstance(metadata, dict) else {}
+
+def load_page_source(page_file_path):
+    """Reads a page file into (metadata, body); a leaner frontmatter.load using the C YAML loader.
+    Pages without a leading --- block never reach the YAML parser."""
+    with open(page_file_path, 'rb') as f: raw_page = f.read()
+    yaml_text, body = split_frontmatter(raw_page.decode('utf-8'))
+    return parse_frontmatter_yaml(yaml_text), body
+
+app.split_frontmatter = split_frontmatter
+app.load_page_source = load_page_source
+
+_TEMPLATE_CACHE = {}
 
 def render_markdown_from_template(template_name, **context):
     try:
-        template = md_jinja_env.get_template(template_name)
+        template = _TEMPLATE_CACHE.get(template_name)
+        if template is None:
+            template = md_jinja_env.get_template(template_name)
+            if not md_jinja_env.auto_reload: _TEMPLATE_CACHE[template_name] = template
         return template.render(context)
     except Exception as e:
         app.logger.error(f"Error rendering Markdown template {template_name}: {e}")
         raise
 
+_PANDOC_ARGS_BASE = tuple(app.config.get('PANDOC_ARGS', []))
+
+def _render_fingerprint():
+    """Hashes the settings that shape rendered HTML besides the page itself: Pandoc arguments and Markdown templates."""
+    digest = hashlib.blake2b(repr(_PANDOC_ARGS_BASE).encode('utf-8'), digest_size=8)
+    with os.scandir(md_template_dir) as entries:
+        for entry in sorted(entries, key=lambda entry: entry.name):
+            digest.update(f"{entry.name}:{entry.stat().st_mtime_ns};".encode('utf-8'))
+    return digest.hexdigest()
+
+# Rendered pages live in a directory named after the fingerprint, so changing the
+# Pandoc arguments or a template makes earlier renders unreachable instead of stale.
+HTML_CACHE_DIR = os.path.join(app.config['CACHE_DIR'], 'html', _render_fingerprint())
+
+def _prune_stale_html_cache():
+    html_cache_root = os.path.dirname(HTML_CACHE_DIR)
+    if not os.path.isdir(html_cache_root): return
+    with os.scandir(html_cache_root) as entries:
+        for entry in entries:
+            if entry.path == HTML_CACHE_DIR: continue
+            try:
+                if entry.is_dir(): shutil.rmtree(entry.path)
+                else: os.remove(entry.path)
+                app.logger.info(f"Removed stale HTML cache entry: {entry.path}")
+            except OSError as e:
+                app.logger.warning(f"Could not remove stale HTML cache entry {entry.path}: {e}")
+
+_prune_stale_html_cache()
+
+def _is_regular_file(path):
+    """One stat() instead of the os.path.exists + os.path.isfile pair."""
+    if not path: return False
+    try:
+        return stat.S_ISREG(os.stat(path).st_mode)
+    except (OSError, ValueError): # As os.path.isfile: missing, unreadable, name too long, embedded NUL
+        return False
+
 def _get_cache_path(page_name_slug):
     safe_slug = page_name_slug.replace('/', '__')
     cache_filename = f"{safe_slug}.html"
-    html_cache_dir = os.path.join(app.config['CACHE_DIR'], 'html')
-    os.makedirs(html_cache_dir, exist_ok=True)
-    return os.path.join(html_cache_dir, cache_filename)
+    return os.path.join(HTML_CACHE_DIR, cache_filename)
+
+def _read_fresh_cache(cache_path, source_path):
+    """Returns the cached HTML if it is newer than its source, else None.
+    The cache file is opened once and its mtime taken from the open descriptor."""
+    if not source_path: return None
+    try:
+        source_mtime = os.stat(source_path).st_mtime
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            if os.fstat(f.fileno()).st_mtime <= source_mtime: return None
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+# --- Lock and Cache Metadata Store ---
+# Edit locks and cached-page metadata live in one SQLite database rather than a
+# small file per page, so a lock check or cache lookup is a single indexed query.
+_store_local = threading.local()
+
+def get_store():
+    """Returns this thread's connection to the store, creating the schema on first use."""
+    connection = getattr(_store_local, 'connection', None)
+    if connection is None:
+        db_path = app.config['STORE_DB']
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        connection = sqlite3.connect(db_path, timeout=10, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.execute('CREATE TABLE IF NOT EXISTS locks (slug TEXT PRIMARY KEY, ts REAL NOT NULL, user TEXT)')
+        connection.execute('CREATE TABLE IF NOT EXISTS cache_meta (slug TEXT PRIMARY KEY, title TEXT, frontmatter TEXT)')
+        _store_local.connection = connection
+    return connection
+
+def get_page_lock(page_name_slug):
+    """Returns (locked_at, user) for a page's edit lock, or None if it is not locked."""
+    row = get_store().execute('SELECT ts, user FROM locks WHERE slug = ?', (page_name_slug,)).fetchone()
+    return (datetime.fromtimestamp(row[0]), row[1]) if row else None
+
+def acquire_page_lock(page_name_slug, user, lock_timeout):
+    """Takes or refreshes the edit lock in one statement, so two editors cannot both get it.
+    Returns None on success, or (locked_at, user) of the lock that is still held by someone else."""
+    while True:
+        now = datetime.now().timestamp()
+        acquired = get_store().execute(
+            'INSERT INTO locks (slug, ts, user) VALUES (?, ?, ?) '
+            'ON CONFLICT(slug) DO UPDATE SET ts = excluded.ts, user = excluded.user '
+            'WHERE locks.user IS excluded.user OR locks.ts < ?',
+            (page_name_slug, now, user, now - lock_timeout)).rowcount > 0
+        if acquired: return None
+        held_lock = get_page_lock(page_name_slug)
+        if held_lock: return held_lock
+        # Released between the two statements; try again.
+
+def remove_page_lock(page_name_slug):
+    return get_store().execute('DELETE FROM locks WHERE slug = ?', (page_name_slug,)).rowcount > 0
+
+def get_cache_meta(page_name_slug):
+    """Returns (title, frontmatter) stored with a page's cached HTML, or None."""
+    row = get_store().execute('SELECT title, frontmatter FROM cache_meta WHERE slug = ?', (page_name_slug,)).fetchone()
+    return (row[0], json.loads(row[1])) if row else None
+
+def set_cache_meta(page_name_slug, title, frontmatter_data):
+    get_store().execute('INSERT OR REPLACE INTO cache_meta (slug, title, frontmatter) VALUES (?, ?, ?)',
+                        (page_name_slug, title, json.dumps(frontmatter_data, ensure_ascii=False, default=str)))
+
+def remove_cache_meta(page_name_slug):
+    get_store().execute('DELETE FROM cache_meta WHERE slug = ?', (page_name_slug,))
 
 # --- Error Handlers ---
 @app.errorhandler(403)
@@ -182,6 +603,20 @@ def page_not_found_error(error): return render_template('html/errors/404.html',
 def favicon(): return '', 204
 
 # --- Routes ---
+PAGE_ENDPOINTS = frozenset({'view_page', 'edit_page', 'save_page', 'delete_page', 'cancel_edit'})
+REDIRECTING_PAGE_ENDPOINTS = frozenset({'view_page', 'edit_page'})
+
+@app.before_request
+def normalize_page_name_slug():
+    """Normalizes the page name once per request; the page routes receive it already slugified."""
+    if request.endpoint not in PAGE_ENDPOINTS: return
+    page_name = request.view_args['page_name']
+    g.page_name_slug = _normalize_page_name(page_name)
+    if page_name == g.page_name_slug: return
+    if request.endpoint in REDIRECTING_PAGE_ENDPOINTS:
+        return redirect(url_for(request.endpoint, page_name=g.page_name_slug), code=308)
+    request.view_args['page_name'] = g.page_name_slug
+
 @app.route('/admin/acl')
 @app.route('/admin/acl/')
 def redirect_to_admin_dashboard():
@@ -200,18 +635,17 @@ def index():
 # -- View page helper functions --
 def _get_page_data(page_name):
     page_extension = app.config['PAGE_EXTENSION']
-    normalized_page_name = '/'.join(slugify(part) for part in filter(None, page_name.split('/')))
+    normalized_page_name = _normalize_page_name(page_name)
     if page_name != normalized_page_name:
         return redirect(url_for('view_page', page_name=normalized_page_name), code=308)
     page_name = normalized_page_name
     try:
         page_file_path = safe_join(app.config['PAGES_DIR'], page_name + page_extension)
         page_name = trigger_hook('before_page_file_access', page_name, page_file_path=page_file_path, app_context=app)
-        if not os.path.exists(page_file_path) or not os.path.isfile(page_file_path):
+        if not _is_regular_file(page_file_path):
             return redirect(url_for('edit_page', page_name=page_name))
-        with open(page_file_path, 'r', encoding='utf-8') as f:
-            article = frontmatter.load(f)
-        hook_data = {'frontmatter': article.metadata, 'body': article.content, 'page_name': page_name}
+        page_metadata, page_body = load_page_source(page_file_path)
+        hook_data = {'frontmatter': page_metadata, 'body': page_body, 'page_name': page_name}
         modified_data = trigger_hook('after_page_load', hook_data, app_context=app)
         return modified_data or hook_data, page_name
     except PermissionError as e: 
@@ -232,9 +666,8 @@ def _process_markdown_content(modified_data, page_name):
         md_render_context = {'frontmatter': original_frontmatter, 'body': original_markdown_body, 'page_name': page_name, 'config': app.config}
         markdown_template_name = original_frontmatter.get('markdown_template', 'article_template.j2md')
         processed_markdown_from_j2 = render_markdown_from_template(markdown_template_name, **md_render_context)
-        processed_article_parts = frontmatter.loads(processed_markdown_from_j2)
-        pandoc_input_frontmatter = processed_article_parts.metadata
-        pandoc_input_body = processed_article_parts.content
+        # The template's YAML block goes to Pandoc verbatim rather than being parsed and dumped again.
+        pandoc_input_yaml, pandoc_input_body = split_frontmatter(processed_markdown_from_j2)
         
         # --- MODIFICATION 1: Pass a dictionary to collect data from hooks ---
         hook_shared_data = {}
@@ -243,7 +676,18 @@ def _process_markdown_content(modified_data, page_name):
         pandoc_input_body = trigger_hook('process_media_links', pandoc_input_body, current_page_slug=page_name, app_context=app, **hook_shared_data)
         pandoc_input_body_with_wikilinks = convert_wikilinks(pandoc_input_body)
 
-        final_markdown_for_pandoc = f"---\n{yaml.dump(pandoc_input_frontmatter, sort_keys=False, allow_unicode=True)}---\n\n{pandoc_input_body_with_wikilinks}"
+        # Files referenced from the metadata block, so the pandoc server can be sent them.
+        # A pandoc subprocess reads them itself, so the block is only parsed in server mode.
+        resource_files = []
+        if app.config.get('PANDOC_SERVER_URL') and pandoc_input_yaml:
+            pandoc_input_frontmatter = parse_frontmatter_yaml(pandoc_input_yaml)
+            for key in ('bibliography', 'csl'):
+                value = pandoc_input_frontmatter.get(key)
+                if value: resource_files.extend(value if isinstance(value, list) else [value])
+        hook_shared_data['resource_files'] = resource_files
+
+        pandoc_input_yaml = pandoc_input_yaml.strip('\n') # Pandoc rejects a blank line right after the opening ---
+        final_markdown_for_pandoc = f"---\n{pandoc_input_yaml}\n---\n\n{pandoc_input_body_with_wikilinks}" if pandoc_input_yaml.strip() else pandoc_input_body_with_wikilinks
         
         # --- MODIFICATION 2: Return both the markdown and the collected data ---
         return final_markdown_for_pandoc, hook_shared_data
@@ -253,33 +697,79 @@ def _process_markdown_content(modified_data, page_name):
         flash(f"The page '{page_name}' could not be processed due to a content error.", "error")
         return redirect(url_for('edit_page', page_name=page_name))
 
-def _render_page_html(final_markdown_for_pandoc, page_name, page_title, original_frontmatter, discovered_metadata=None):
-    """Convert processed markdown to HTML using Pandoc."""
+def _source_mtime_ns(source_path):
+    try:
+        return os.stat(source_path).st_mtime_ns if source_path else None
+    except (OSError, ValueError):
+        return None
+
+def _write_page_cache(page_name, html_content_fragment, page_title, original_frontmatter, rendered_path=None, source_path=None, source_mtime_ns=None):
+    """Stores a rendered page. rendered_path is a file Pandoc already wrote the HTML to; it is moved into place.
+    If the source changed since source_mtime_ns was taken (a save during rendering), nothing is cached:
+    the new cache file would be newer than the edited source and be served in its place."""
+    cache_path = _get_cache_path(page_name)
     try:
-        pandoc_args = list(app.config.get('PANDOC_ARGS', [])) # Use list() to ensure it's a mutable copy
+        if source_path and _source_mtime_ns(source_path) != source_mtime_ns:
+            app.logger.info(f"Page '{page_name}' changed while rendering; not caching it.")
+            if rendered_path: os.remove(rendered_path)
+            return
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        # Metadata first: the HTML file's mtime is what marks the cache entry as current.
+        set_cache_meta(page_name, page_title, original_frontmatter)
+        if rendered_path:
+            os.replace(rendered_path, cache_path)
+        else:
+            with open(cache_path, 'w', encoding='utf-8') as f: f.write(html_content_fragment)
+        # A save that landed between the check above and the write: drop the entry just written.
+        if source_path and _source_mtime_ns(source_path) != source_mtime_ns:
+            os.remove(cache_path)
+            return
+        app.logger.info(f"HTML for page '{page_name}' saved to cache: {cache_path}")
+    except Exception as e:
+        app.logger.error(f"Failed to write to cache for page '{page_name}': {e}")
+
+def _render_page_html(final_markdown_for_pandoc, page_name, page_title, original_frontmatter, discovered_metadata=None, source_path=None, source_mtime_ns=None):
+    """Convert processed markdown to HTML using Pandoc. source_mtime_ns is the source file's mtime from before it was read."""
+    try:
+        pandoc_args = _PANDOC_ARGS_BASE # Shared tuple; copied below only when something adds to it
         
         # --- MODIFICATION 3: Use the discovered metadata to augment pandoc_args ---
         if discovered_metadata and 'discovered_bibliographies' in discovered_metadata:
             bib_dir = app.config.get('BIB_DIR', 'data/bibliographies')
+            extra_bib_args = []
             for bib_file in discovered_metadata['discovered_bibliographies']:
                 # Construct full, safe path and add to args
                 full_bib_path = safe_join(bib_dir, bib_file)
                 if full_bib_path and os.path.exists(full_bib_path):
-                    pandoc_args.append(f'--bibliography={full_bib_path}')
+                    extra_bib_args.append(f'--bibliography={full_bib_path}')
                 else:
                     app.logger.warning(f"Discovered bibliography '{bib_file}' not found at '{full_bib_path}'.")
+            if extra_bib_args: pandoc_args = [*pandoc_args, *extra_bib_args]
+
+        # Hooks may append to the arguments in place, so they get their own list.
+        if PLUGIN_HOOKS.get('before_pandoc_conversion'): pandoc_args = list(pandoc_args)
 
         pandoc_args = trigger_hook('before_pandoc_conversion', pandoc_args, markdown_content=final_markdown_for_pandoc, app_context=app)
         
-        html_content_fragment = pypandoc.convert_text(to='html5', format='markdown', source=final_markdown_for_pandoc, extra_args=pandoc_args)
+        resource_files = (discovered_metadata or {}).get('resource_files', [])
+        # Unless a hook rewrites the HTML, Pandoc writes it straight to a file beside the cache entry,
+        # which is then moved into place, rather than the whole string being written out again.
+        rendered_path = None
+        if not PLUGIN_HOOKS.get('after_pandoc_conversion'):
+            cache_dir = os.path.dirname(_get_cache_path(page_name))
+            os.makedirs(cache_dir, exist_ok=True)
+            # mkstemp names are unique across worker processes too, unlike thread idents
+            fd, rendered_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+            os.fchmod(fd, 0o644) # mkstemp creates 0600; keep the mode a plain open() would give
+            os.close(fd)
+        try:
+            html_content_fragment = pandoc_convert(final_markdown_for_pandoc, 'html5', format='markdown', extra_args=pandoc_args, resource_files=resource_files, outputfile=rendered_path)
+        except Exception:
+            if rendered_path and os.path.exists(rendered_path): os.remove(rendered_path)
+            raise
         
         html_content_fragment = trigger_hook('after_pandoc_conversion', html_content_fragment, page_name=page_name, app_context=app)
-        cache_path = _get_cache_path(page_name)
-        try:
-            with open(cache_path, 'w', encoding='utf-8') as f: f.write(html_content_fragment)
-            app.logger.info(f"HTML for page '{page_name}' saved to cache: {cache_path}")
-        except Exception as e:
-            app.logger.error(f"Failed to write to cache for page '{page_name}': {e}")
+        _write_page_cache(page_name, html_content_fragment, page_title, original_frontmatter, rendered_path, source_path, source_mtime_ns)
 
         render_context = {'title': page_title, 'html_content': html_content_fragment, 'frontmatter': original_frontmatter, 'page_name': page_name}
         render_context = trigger_hook('before_html_render', dict(render_context), app_context=app)
@@ -293,27 +783,33 @@ def _render_page_html(final_markdown_for_pandoc, page_name, page_title, original
         flash(f"The page '{page_name}' could not be rendered due to an unexpected error.", "error")
         return redirect(url_for('edit_page', page_name=page_name))
 
-def _get_lock_path(page_name_slug):
-    safe_slug = page_name_slug.replace('/', '__')
-    lock_filename = f"{safe_slug}.lock"
-    return os.path.join(app.config['LOCKS_DIR'], lock_filename)
-
 # ----
 
 @app.route('/<path:page_name>')
 def view_page(page_name):
     # Caching Logic remains the same...
     cache_path, source_path = _get_cache_path(page_name), safe_join(app.config['PAGES_DIR'], page_name + app.config['PAGE_EXTENSION'])
-    if os.path.exists(cache_path) and os.path.exists(source_path) and os.path.getmtime(cache_path) > os.path.getmtime(source_path):
+    try:
+        cached_html = _read_fresh_cache(cache_path, source_path)
+    except Exception as e:
+        cached_html = None
+        app.logger.error(f"Error reading cache for '{page_name}': {e}")
+    if cached_html is not None:
         app.logger.info(f"Serving '{page_name}' from cache.")
         try:
-            with open(cache_path, 'r', encoding='utf-8') as f: cached_html = f.read()
-            with open(source_path, 'r', encoding='utf-8') as f: article = frontmatter.load(f)
-            page_title = article.metadata.get('title', page_name.replace('/', ' / ').title())
-            return render_template('html/page_layout.html', title=page_title, html_content=cached_html, frontmatter=article.metadata, page_name=page_name)
+            cached_meta = get_cache_meta(page_name)
+            if cached_meta:
+                page_title, page_frontmatter = cached_meta
+            else:
+                page_frontmatter, _page_body = load_page_source(source_path)
+                page_title = page_frontmatter.get('title', page_name.replace('/', ' / ').title())
+                # Entries cached before metadata was stored get it now, so only the first hit parses YAML.
+                set_cache_meta(page_name, page_title, page_frontmatter)
+            return render_template('html/page_layout.html', title=page_title, html_content=cached_html, frontmatter=page_frontmatter, page_name=page_name)
         except Exception as e:
             app.logger.error(f"Error reading cache for '{page_name}': {e}")
     
+    source_mtime_ns = _source_mtime_ns(source_path) # Before the read, so a save during rendering is noticed
     result = _get_page_data(page_name)
     if not isinstance(result, tuple): return result
     modified_data, final_page_name = result
@@ -325,22 +821,20 @@ def view_page(page_name):
         return final_markdown_for_pandoc
     
     # --- MODIFICATION 5: Pass the extra data to the renderer ---
-    return _render_page_html(final_markdown_for_pandoc, final_page_name, page_title, original_frontmatter=modified_data.get('frontmatter', {}), discovered_metadata=discovered_metadata)
+    return _render_page_html(final_markdown_for_pandoc, final_page_name, page_title, original_frontmatter=modified_data.get('frontmatter', {}), discovered_metadata=discovered_metadata,
+                             source_path=source_path, source_mtime_ns=source_mtime_ns)
 
 
 # ... (The rest of your app.py file remains the same) ...
 
+NEW_PAGE_TEMPLATE = string.Template(app.config.get('NEW_PAGE_TEMPLATE', '---\ntitle: "$title"\n---\n\nStart writing...'))
+
 @app.route('/<path:page_name>/edit', methods=['GET'])
 def edit_page(page_name):
-    normalized_page_name = '/'.join(slugify(part) for part in filter(None, page_name.split('/')))
-    if page_name != normalized_page_name:
-        return redirect(url_for('edit_page', page_name=normalized_page_name), code=308)
-    page_name = normalized_page_name
-    
     try:
         from plugins.acl_plugin import check_permission
         page_file_path = safe_join(app.config['PAGES_DIR'], page_name + '.md')
-        page_exists_check = os.path.exists(page_file_path) and os.path.isfile(page_file_path)
+        page_exists_check = _is_regular_file(page_file_path)
         required_action = "edit_page" if page_exists_check else "create_page"
 
         if not check_permission(app, g.get('current_user'), required_action, page_name):
@@ -351,25 +845,12 @@ def edit_page(page_name):
                  flash(f"You do not have permission to {required_action.replace('_page', '')} this page.", "error")
                  abort(403)
 
-        lock_path = _get_lock_path(page_name)
-        locks_dir = app.config['LOCKS_DIR']
-        os.makedirs(locks_dir, exist_ok=True)
-        if os.path.exists(lock_path):
-            try:
-                with open(lock_path, 'r', encoding='utf-8') as f:
-                    lock_timestamp_str, lock_user = f.read().strip().split(';', 1)
-                lock_time = datetime.fromisoformat(lock_timestamp_str)
-                time_since_lock = (datetime.now() - lock_time).total_seconds()
-                if time_since_lock > app.config.get('LOCK_TIMEOUT', 1800):
-                    os.remove(lock_path)
-                elif lock_user != g.get('current_user', 'anonymous'):
-                    flash(f"This page is locked by '{lock_user}'.", "warning")
-                    return redirect(url_for('view_page', page_name=page_name))
-            except Exception as e:
-                os.remove(lock_path)
-        with open(lock_path, 'w', encoding='utf-8') as f:
-            f.write(f"{datetime.now().isoformat()};{g.get('current_user', 'anonymous')}")
-        app.logger.info(f"Lock created for page '{page_name}' at {lock_path}")
+        held_lock = acquire_page_lock(page_name, g.get('current_user', 'anonymous'), app.config.get('LOCK_TIMEOUT', 1800))
+        if held_lock:
+            _lock_time, lock_user = held_lock
+            flash(f"This page is locked by '{lock_user}'.", "warning")
+            return redirect(url_for('view_page', page_name=page_name))
+        app.logger.info(f"Lock created for page '{page_name}'")
     except PermissionError as e: 
         flash(str(e), "error")
         if g.get('current_user') is None: return redirect(url_for('auth_plugin.login_route', next=url_for('edit_page', page_name=page_name)))
@@ -379,7 +860,7 @@ def edit_page(page_name):
     if page_exists_check: 
         with open(page_file_path, 'r', encoding='utf-8') as f: raw_content = f.read()
     else: 
-        raw_content = f"---\ntitle: \"{default_title}\"\ndate: \"{datetime.now().strftime('%Y-%m-%d')}\"\nauthor: \"{g.get('current_user', 'Your Name')}\"\n---\n\nStart writing..."
+        raw_content = NEW_PAGE_TEMPLATE.safe_substitute(title=default_title, date=datetime.now().strftime('%Y-%m-%d'), author=g.get('current_user', 'Your Name'))
     
     edit_page_data = {'page_name': page_name, 'raw_content': raw_content, 'title': f"Edit {default_title}", 'page_exists': page_exists_check}
     edit_page_data = trigger_hook('before_edit_page_render', dict(edit_page_data), app_context=app)
@@ -387,7 +868,6 @@ def edit_page(page_name):
 
 @app.route('/<path:page_name>/save', methods=['POST'])
 def save_page(page_name):
-    page_name = '/'.join(slugify(part) for part in filter(None, page_name.split('/')))
     try:
         raw_content_from_form = request.form.get('raw_content')
         if raw_content_from_form is None: abort(400, "No content.")
@@ -397,13 +877,11 @@ def save_page(page_name):
         with open(page_file_path, 'w', encoding='utf-8') as f: f.write(raw_content_to_save)
         flash(f"Page '{page_name}' saved.", "success")
         trigger_hook('after_page_save', page_name, file_path=page_file_path, app_context=app)
-        lock_path = _get_lock_path(page_name)
-        if os.path.exists(lock_path):
-            try:
-                os.remove(lock_path)
-                app.logger.info(f"Lock file removed for page: {page_name}")
-            except OSError as e:
-                app.logger.error(f"Error removing lock file {lock_path}: {e}")
+        try:
+            if remove_page_lock(page_name):
+                app.logger.info(f"Lock removed for page: {page_name}")
+        except sqlite3.Error as e:
+            app.logger.error(f"Error removing lock for page {page_name}: {e}")
         return redirect(url_for('view_page', page_name=page_name))
     except PermissionError as e: 
         flash(str(e), "error")
@@ -415,18 +893,18 @@ def save_page(page_name):
 
 @app.route('/<path:page_name>/delete', methods=['POST'])
 def delete_page(page_name):
-    page_name = '/'.join(slugify(part) for part in filter(None, page_name.split('/')))
     try:
         page_file_path = safe_join(app.config['PAGES_DIR'], page_name + '.md')
         if trigger_hook('before_page_delete', False, page_name=page_name, file_path=page_file_path, app_context=app):
              return redirect(url_for('edit_page', page_name=page_name))
-        if os.path.exists(page_file_path) and os.path.isfile(page_file_path):
+        if _is_regular_file(page_file_path):
             os.remove(page_file_path)
             flash(f"Page '{page_name}' deleted.", "success")
             trigger_hook('after_page_delete', page_name, file_path=page_file_path, app_context=app)
-            for path_func in [_get_lock_path, _get_cache_path]:
-                path = path_func(page_name)
-                if os.path.exists(path): os.remove(path)
+            remove_page_lock(page_name)
+            remove_cache_meta(page_name)
+            cache_path = _get_cache_path(page_name)
+            if os.path.exists(cache_path): os.remove(cache_path)
             return redirect(url_for('index')) 
         else:
             flash(f"Page '{page_name}' not found.", "error")
@@ -437,14 +915,12 @@ def delete_page(page_name):
 
 @app.route('/<path:page_name>/cancel-edit', methods=['POST'])
 def cancel_edit(page_name):
-    page_name = '/'.join(slugify(part) for part in filter(None, page_name.split('/')))
-    lock_path = _get_lock_path(page_name)
-    if os.path.exists(lock_path):
+    existing_lock = get_page_lock(page_name)
+    if existing_lock:
         try:
-            with open(lock_path, 'r', encoding='utf-8') as f:
-                _lock_timestamp, lock_user = f.read().strip().split(';', 1)
+            _lock_time, lock_user = existing_lock
             if lock_user == g.get('current_user'):
-                os.remove(lock_path)
+                remove_page_lock(page_name)
                 flash("Edit canceled.", "info")
             else:
                 flash("You cannot unlock this page.", "error")
@@ -457,9 +933,11 @@ def cancel_edit(page_name):
 def serve_media_file(filename):
     media_dir = app.config.get('MEDIA_DIR')
     if not media_dir or ".." in filename or filename.startswith("/"): abort(404)
-    return send_from_directory(media_dir, filename)
+    # Conditional responses turn repeat requests into 304s; the body itself goes out through wsgi.file_wrapper.
+    return send_from_directory(media_dir, filename, conditional=True, max_age=app.config.get('MEDIA_MAX_AGE', 0))
 
 if __name__ == '__main__':
+    import pypandoc
     try:
         pypandoc.get_pandoc_version()
     except OSError:
@@ -6,7 +6,7 @@ FLASK_SECRET_KEY = os.environ.get('','shh')
 APP_ROOT = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = 'data'
 PAGES_DIR = os.path.join(DATA_DIR, 'pages')
-LOCKS_DIR = os.path.join(DATA_DIR, 'locks')
+STORE_DB = os.path.join(DATA_DIR, 'pandoky.sqlite3') # Edit locks and cached-page metadata
 LOCK_TIMEOUT = 1800 # Lock timeout in seconds (1800 = 30 minutes)
 BIB_DIR = os.path.join(DATA_DIR, 'bibliographies')
 CSL_DIR = os.path.join(DATA_DIR, 'csl')
@@ -14,6 +14,8 @@ CACHE_DIR = os.path.join(APP_ROOT, 'cache') # For storing rendered HTML
 
 # Page configuration
 PAGE_EXTENSION = ".md"
+# Starting content for new pages (string.Template syntax: $title, $date and $author are filled in)
+NEW_PAGE_TEMPLATE = '---\ntitle: "$title"\ndate: "$date"\nauthor: "$author"\n---\n\nStart writing...'
 
 
 
@@ -22,6 +24,7 @@ MEDIA_DIR_NAME = 'media' # Subdirectory name within DATA_DIR
 MEDIA_DIR = os.path.join(DATA_DIR, MEDIA_DIR_NAME)
 ALLOWED_MEDIA_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'svg', 'webp', 'mp4', 'webm', 'ogg', 'pdf'}
 MEDIA_URL_PREFIX = '/media' # How media files will be accessed via URL
+MEDIA_MAX_AGE = 60 * 60 * 24 * 7 # Seconds browsers may reuse a media file before revalidating it
 
 # Slides
 SLIDESHOW_DIR = os.path.join(APP_ROOT, 'cache', 'slideshows')
@@ -30,13 +33,22 @@ SLIDESHOW_DIR = os.path.join(APP_ROOT, 'cache', 'slideshows')
 DEFAULT_BIB = os.path.join(BIB_DIR,"references.yaml")
 DEFAULT_CSL = os.path.join(CSL_DIR,"chicago-17.csl")
 DEFAULT_PANDOC_MATH_RENDERER = '--mathjax=https://cdn.jsdelivr.net/npm/mathjax@3/es5/tex-mml-chtml.js' # e.g., 'mathjax', 'katex'
-PANDOC_ARGS = [
+PANDOC_ARGS = (
     '--citeproc',
     '--shift-heading-level-by=1',
     #    DEFAULT_PANDOC_MATH_RENDERER,
     f'--bibliography={DEFAULT_BIB}',
     f'--csl={DEFAULT_CSL}'
-]
+) # A tuple: shared read-only across requests
+
+# Pandoc server. Set PANDOC_SERVER_URL to use an already-running `pandoc server`,
+# or PANDOC_SERVER_AUTOSTART to have the app spawn one on PANDOC_SERVER_PORT.
+# Without either, every conversion spawns a new pandoc process.
+PANDOC_SERVER_URL = os.environ.get('PANDOC_SERVER_URL') # e.g., 'http://127.0.0.1:3030'
+PANDOC_SERVER_AUTOSTART = os.environ.get('PANDOC_SERVER_AUTOSTART', 'false').lower() in ['true', '1', 't']
+PANDOC_SERVER_PORT = int(os.environ.get('PANDOC_SERVER_PORT', 3030))
+PANDOC_SERVER_TIMEOUT = 30 # Seconds allowed for a single conversion
+PANDOC_TIMEOUT = 60 # Seconds a pandoc subprocess may run before it is killed and a rendering error reported
 
 # Email Configuration 
 MAIL_SERVER = os.environ.get('MAIL_SERVER')
@@ -1,17 +1,55 @@
 # plugins/cluster_plugin.py
 
 import os
+import re
 import json
+from array import array
 import numpy as np
-from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app
-from sklearn.feature_extraction import DictVectorizer
-from sklearn.cluster import KMeans
-from collections import defaultdict
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, g, has_request_context
+from scipy.sparse import csr_matrix
+
+# scikit-learn-intelex swaps in a vectorized oneDAL KMeans when installed. It has to
+# patch sklearn before KMeans is imported below.
+try:
+    from sklearnex import patch_sklearn
+    patch_sklearn("kmeans")
+    SKLEARNEX_PATCHED = True
+except ImportError:
+    SKLEARNEX_PATCHED = False
+
+from sklearn.cluster import KMeans, MiniBatchKMeans
+
+# The indexer's vector file is parsed on every clustering run; orjson does that several
+# times faster than the json module. Output keeps the json module's layout when it's missing.
+try:
+    import orjson
+    _decode_json = orjson.loads
+    def _encode_json(data): return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    _encode_json_compact = orjson.dumps
+except ImportError:
+    _decode_json = json.loads
+    def _encode_json(data): return json.dumps(data, indent=4, ensure_ascii=False).encode('utf-8')
+    def _encode_json_compact(data): return json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+# Optional: lets the TF-IDF matrix be built while the vectors file is parsed, without
+# first holding every page's vector as a Python dict.
+try:
+    import ijson
+except ImportError:
+    ijson = None
 
 # --- Configuration ---
 CLUSTER_BLUEPRINT_NAME = 'cluster_plugin'
 CONFIG_FILENAME = "cluster_config.json"
 CLUSTER_DATA_FILENAME = "cluster_data.json"
+# Binary copy of the indexer's vectors, read in preference to the JSON when up to date
+TFIDF_MATRIX_FILENAME = "cluster_tfidf_matrix.npz"
+
+# Above this many pages, mini-batch k-means gets within a few percent of the full
+# algorithm's inertia in a fraction of the time.
+MINIBATCH_KMEANS_MIN_PAGES = 2000
+
+CLUSTER_MACRO_RE = re.compile(r'~~(CLUSTER_MEMBERS|CLUSTER_LIST)~~')
 # Filenames from the indexer plugin are now all needed
 PAGE_META_FILENAME = "indexer_page_meta.json"
 VECTORS_FILENAME = "indexer_tfidf_vectors.json"
@@ -25,32 +63,170 @@ cluster_bp = Blueprint(
 )
 
 # --- Helper Functions ---
+def pretty_page_name(page_slug):
+    return page_slug.replace('/', ' / ').replace('-', ' ').title()
+
 def get_config_path(app_instance):
     return os.path.join(app_instance.config['DATA_DIR'], CONFIG_FILENAME)
 
 def get_cluster_data_path(app_instance):
     return os.path.join(app_instance.config['DATA_DIR'], CLUSTER_DATA_FILENAME)
 
+def load_json_data(app_instance, filename, default_data=None):
+    if default_data is None: default_data = {}
+    file_path = os.path.join(app_instance.config['DATA_DIR'], filename)
+    if os.path.exists(file_path):
+        with open(file_path, 'rb') as f:
+            return _decode_json(f.read())
+    return default_data
+
 def load_config(app_instance):
     config_path = get_config_path(app_instance)
     if os.path.exists(config_path):
-        with open(config_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        with open(config_path, 'rb') as f:
+            return _decode_json(f.read())
     return {'num_clusters': 5, 'num_top_terms': 3}
 
 def save_config(app_instance, config_data):
     config_path = get_config_path(app_instance)
-    with open(config_path, 'w', encoding='utf-8') as f:
-        json.dump(config_data, f, indent=4)
+    with open(config_path, 'wb') as f:
+        f.write(_encode_json(config_data))
 
 def load_cluster_data(app_instance):
+    """Loads cluster data at most once per request; both cluster macros on a page share it."""
+    if not has_request_context():
+        return _read_cluster_data(app_instance)
+    cluster_data = g.get('_cluster_data')
+    if cluster_data is None:
+        cluster_data = g._cluster_data = _read_cluster_data(app_instance)
+    return cluster_data
+
+def _read_cluster_data(app_instance):
     cluster_data_path = get_cluster_data_path(app_instance)
-    if os.path.exists(cluster_data_path):
-        with open(cluster_data_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {'clusters': {}, 'page_to_cluster': {}, 'cluster_names': {}}
+    try:
+        with open(cluster_data_path, 'rb') as f:
+            return _decode_json(f.read())
+    except FileNotFoundError:
+        pass
+    except Exception as e: # Unreadable or corrupt: render pages without cluster lists rather than fail
+        app_instance.logger.error(f"ClusterPlugin: Could not read {cluster_data_path}: {e}")
+    return {'clusters': {}, 'page_to_cluster': {}, 'cluster_names': {}, 'display_names': {}}
+
+def save_cluster_data(app_instance, cluster_data):
+    # Machine-read and holds every slug twice, so it's written compactly; orjson parses
+    # it about as fast as a binary format would load.
+    cluster_data_path = get_cluster_data_path(app_instance)
+    with open(cluster_data_path + '.tmp', 'wb') as f:
+        f.write(_encode_json_compact(cluster_data))
+    os.replace(cluster_data_path + '.tmp', cluster_data_path)
+
+def create_default_file(file_path, default_content, encode=_encode_json):
+    """Writes default_content unless the file already exists; O_EXCL makes the check and the create one step."""
+    try:
+        fd = os.open(file_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, 'wb') as f:
+        f.write(encode(default_content))
+    return True
 
 # --- Core Clustering Logic ---
+def top_k_columns(centroids, k):
+    """
+    Column indices of each centroid's k largest weights, strongest first. Centroids come back
+    dense but only cover terms their pages use, so partitioning runs over each row's
+    nonzeros. Rows with fewer than k nonzero terms return fewer columns.
+    """
+    centers = csr_matrix(centroids)
+    top_columns = []
+    for row in range(centers.shape[0]):
+        start, end = centers.indptr[row], centers.indptr[row + 1]
+        values, columns = centers.data[start:end], centers.indices[start:end]
+        if k < len(values):
+            top = np.argpartition(-values, k - 1)[:k]
+        else:
+            top = np.arange(len(values))
+        top_columns.append(columns[top[np.argsort(-values[top], kind='stable')]])
+    return top_columns
+
+def build_tfidf_matrix(all_vectors, num_terms):
+    """Returns (sorted page ids, CSR matrix) for the indexer's {page_id: {word_id: weight}} vectors."""
+    page_ids_sorted = sorted(all_vectors.keys(), key=int)
+    # Vector keys are already vocabulary word ids, so they are used directly as
+    # column indices and the CSR arrays are filled in a single pass.
+    indptr = [0]
+    indices = []
+    data = []
+    for pid in page_ids_sorted:
+        vec = all_vectors[pid]
+        indices.extend(map(int, vec.keys()))
+        data.extend(vec.values())
+        indptr.append(len(indices))
+    indices = np.asarray(indices, dtype=np.int32)
+    num_terms = max(num_terms, int(indices.max()) + 1 if indices.size else 0)
+    tfidf_matrix = csr_matrix(
+        (np.asarray(data, dtype=np.float32), indices, np.asarray(indptr, dtype=np.int32)),
+        shape=(len(page_ids_sorted), num_terms))
+    tfidf_matrix.sort_indices()
+    return page_ids_sorted, tfidf_matrix
+
+def stream_tfidf_matrix(vectors_path, num_terms):
+    """
+    Same result as build_tfidf_matrix, but rows are appended as ijson yields each page, into
+    flat typed arrays. Pages arrive in file order rather than id order, so rows are permuted
+    once at the end. That costs a copy of the finished matrix but keeps peak memory near
+    the size of the matrix itself rather than several times the size of the JSON.
+    """
+    page_ids = []
+    indptr = array('l', [0])
+    indices = array('l')
+    data = array('f')
+    with open(vectors_path, 'rb') as f:
+        for pid, vec in ijson.kvitems(f, '', use_float=True):
+            page_ids.append(int(pid))
+            indices.extend(map(int, vec.keys()))
+            data.extend(vec.values())
+            indptr.append(len(indices))
+    indices = np.asarray(indices, dtype=np.int32)
+    num_terms = max(num_terms, int(indices.max()) + 1 if indices.size else 0)
+    tfidf_matrix = csr_matrix(
+        (np.asarray(data, dtype=np.float32), indices, np.asarray(indptr, dtype=np.int32)),
+        shape=(len(page_ids), num_terms))
+    order = np.argsort(np.asarray(page_ids, dtype=np.int64), kind='stable')
+    tfidf_matrix = tfidf_matrix[order]
+    tfidf_matrix.sort_indices()
+    return [str(page_ids[i]) for i in order], tfidf_matrix
+
+def load_tfidf_matrix(app_instance, vectors_path, vocabulary):
+    """
+    Loads the TF-IDF matrix from the .npz copy made on an earlier run when the indexer's
+    vectors haven't changed since; otherwise parses the JSON and refreshes that copy.
+    """
+    matrix_path = os.path.join(app_instance.config['DATA_DIR'], TFIDF_MATRIX_FILENAME)
+    vectors_mtime_ns = os.stat(vectors_path).st_mtime_ns
+    try:
+        with np.load(matrix_path) as npz:
+            if int(npz['vectors_mtime_ns']) == vectors_mtime_ns:
+                tfidf_matrix = csr_matrix((npz['data'], npz['indices'], npz['indptr']), shape=tuple(npz['shape']))
+                return [str(pid) for pid in npz['page_ids']], tfidf_matrix
+    except Exception: # Missing, stale-format or corrupt (e.g. BadZipFile); rebuild from the JSON
+        pass
+
+    num_terms = int(vocabulary.get("next_word_id", 0))
+    if ijson is not None:
+        page_ids_sorted, tfidf_matrix = stream_tfidf_matrix(vectors_path, num_terms)
+    else:
+        page_ids_sorted, tfidf_matrix = build_tfidf_matrix(load_json_data(app_instance, VECTORS_FILENAME), num_terms)
+    try:
+        with open(matrix_path + '.tmp', 'wb') as f:
+            np.savez(f, data=tfidf_matrix.data, indices=tfidf_matrix.indices, indptr=tfidf_matrix.indptr,
+                     shape=np.asarray(tfidf_matrix.shape), page_ids=np.asarray(page_ids_sorted, dtype=np.int64),
+                     vectors_mtime_ns=np.int64(vectors_mtime_ns))
+        os.replace(matrix_path + '.tmp', matrix_path)
+    except OSError as e:
+        app_instance.logger.warning(f"ClusterPlugin: Could not write TF-IDF matrix cache {matrix_path}: {e}")
+    return page_ids_sorted, tfidf_matrix
+
 def run_clustering(app_instance, num_clusters, num_top_terms):
     data_dir = app_instance.config['DATA_DIR']
     vectors_path = os.path.join(data_dir, VECTORS_FILENAME)
@@ -63,19 +239,14 @@ def run_clustering(app_instance, num_clusters, num_top_terms):
 
     try:
         page_meta = load_json_data(app_instance, PAGE_META_FILENAME)
-        all_vectors = load_json_data(app_instance, VECTORS_FILENAME)
         vocabulary = load_json_data(app_instance, VOCABULARY_FILENAME)
         id_to_word = vocabulary.get("id_to_word", {})
         
-        page_ids_sorted = sorted(all_vectors.keys(), key=int)
-        vector_list = [all_vectors[pid] for pid in page_ids_sorted]
+        page_ids_sorted, tfidf_matrix = load_tfidf_matrix(app_instance, vectors_path, vocabulary)
 
-        if not vector_list:
+        if not page_ids_sorted:
             flash("No page data found to cluster.", "error")
             return False
-
-        vectorizer = DictVectorizer(sparse=True)
-        tfidf_matrix = vectorizer.fit_transform(vector_list)
         
         id_to_slug = page_meta.get("id_to_slug", {})
         page_slugs = [id_to_slug.get(pid) for pid in page_ids_sorted]
@@ -88,40 +259,45 @@ def run_clustering(app_instance, num_clusters, num_top_terms):
         flash(f"Cannot create {num_clusters} clusters with only {tfidf_matrix.shape[0]} pages.", "error")
         return False
         
-    kmeans = KMeans(n_clusters=num_clusters, random_state=42, n_init=10)
+    if tfidf_matrix.shape[0] > MINIBATCH_KMEANS_MIN_PAGES:
+        kmeans = MiniBatchKMeans(n_clusters=num_clusters, random_state=42, n_init=3, batch_size=1024, max_iter=100)
+    else:
+        kmeans = KMeans(n_clusters=num_clusters, random_state=42, n_init=10)
     kmeans.fit(tfidf_matrix)
     
     # --- Cluster Naming Logic ---
     cluster_names = {}
-    feature_names = vectorizer.get_feature_names_out() 
     centroids = kmeans.cluster_centers_
-    top_term_indices = centroids.argsort()[:, ::-1][:, :num_top_terms]
+    top_term_indices = top_k_columns(centroids, num_top_terms)
     
     for i, top_indices in enumerate(top_term_indices):
         cluster_id_str = str(i)
         top_words = []
         for term_index in top_indices:
-            word_id = feature_names[term_index]
-            word = id_to_word.get(str(word_id), "unknown")
+            word = id_to_word.get(str(term_index), "unknown")
             top_words.append(word.capitalize())
         cluster_names[cluster_id_str] = " - ".join(top_words)
 
-    clusters = defaultdict(list)
-    page_to_cluster = {}
-    for i, label in enumerate(kmeans.labels_):
-        page_slug = page_slugs[i]
-        if not page_slug: continue
-        cluster_id = str(label)
-        clusters[cluster_id].append(page_slug)
-        page_to_cluster[page_slug] = cluster_id
+    # Group pages by label with one stable sort; members keep page id order within a cluster.
+    slugs = np.asarray(page_slugs, dtype=object)
+    has_slug = np.fromiter((bool(slug) for slug in page_slugs), dtype=bool, count=len(page_slugs))
+    labels = np.asarray(kmeans.labels_)[has_slug]
+    slugs = slugs[has_slug]
+    order = np.argsort(labels, kind='stable')
+    sorted_slugs = slugs[order]
+    bounds = np.searchsorted(labels[order], np.arange(num_clusters + 1))
+    clusters = {str(c): sorted_slugs[bounds[c]:bounds[c + 1]].tolist()
+                for c in range(num_clusters) if bounds[c] < bounds[c + 1]}
+    page_to_cluster = dict(zip(slugs.tolist(), labels.astype(str).tolist()))
 
     # Save all data including the new names
-    with open(get_cluster_data_path(app_instance), 'w', encoding='utf-8') as f:
-        json.dump({
-            'clusters': clusters, 
-            'page_to_cluster': page_to_cluster, 
-            'cluster_names': cluster_names
-        }, f, indent=4)
+    save_cluster_data(app_instance, {
+        'clusters': clusters, 
+        'page_to_cluster': page_to_cluster, 
+        'cluster_names': cluster_names,
+        # Link text for each page, so rendering the macros does no string work per slug
+        'display_names': {slug: pretty_page_name(slug) for slug in page_to_cluster}
+    })
     
     flash(f"Successfully clustered pages and generated names for {num_clusters} clusters.", "success")
     return True
@@ -142,10 +318,31 @@ def clustering_admin_page():
 
 
 # --- Macro Processing ---
+# Rendered macro markdown, valid while cluster_data.json keeps the same mtime. Clusters only
+# change when an admin reclusters, so pages normally skip loading cluster data altogether.
+_MACRO_CACHE = {}
+
+def get_macro_cache(app_instance):
+    try:
+        mtime_ns = os.stat(get_cluster_data_path(app_instance)).st_mtime_ns
+    except OSError:
+        mtime_ns = None
+    cache = _MACRO_CACHE.get('entry')
+    if cache is None or cache['mtime_ns'] != mtime_ns:
+        cache = _MACRO_CACHE['entry'] = {'mtime_ns': mtime_ns, 'full_list': None, 'members': {}}
+    return cache
+
 def generate_full_cluster_list(app_instance):
+    cache = get_macro_cache(app_instance)
+    if cache['full_list'] is None:
+        cache['full_list'] = _build_full_cluster_list(app_instance)
+    return cache['full_list']
+
+def _build_full_cluster_list(app_instance):
     cluster_data = load_cluster_data(app_instance)
     all_clusters = cluster_data.get('clusters', {})
     cluster_names = cluster_data.get('cluster_names', {})
+    display_names = cluster_data.get('display_names', {})
 
     if not all_clusters:
         return "*No clusters have been generated yet.*"
@@ -157,44 +354,55 @@ def generate_full_cluster_list(app_instance):
         
         pages_in_cluster = sorted(all_clusters[cluster_id])
         for page_slug in pages_in_cluster:
-            display_name = page_slug.replace('/', ' / ').replace('-', ' ').title()
+            display_name = display_names.get(page_slug) or pretty_page_name(page_slug)
             output_md_parts.append(f"* [[{page_slug}|{display_name}]]")
         output_md_parts.append("")
 
     return "\n".join(output_md_parts)
 
+def generate_cluster_members_list(app_instance, current_page_slug):
+    members = get_macro_cache(app_instance)['members']
+    members_md = members.get(current_page_slug)
+    if members_md is None:
+        members_md = members[current_page_slug] = _build_cluster_members_list(app_instance, current_page_slug)
+    return members_md
+
+def _build_cluster_members_list(app_instance, current_page_slug):
+    cluster_data = load_cluster_data(app_instance)
+    page_to_cluster = cluster_data.get('page_to_cluster', {})
+    current_cluster_id = page_to_cluster.get(current_page_slug)
+    if current_cluster_id is None:
+        return '*This page has not been clustered yet.*'
+    cluster_members = cluster_data.get('clusters', {}).get(current_cluster_id, [])
+    display_names = cluster_data.get('display_names', {})
+    list_items = [f"* [[{ps}|{display_names.get(ps) or pretty_page_name(ps)}]]" 
+                  for ps in sorted(cluster_members) if ps != current_page_slug]
+    return "\n".join(list_items) if list_items else "*No other pages found in this cluster.*"
+
 def process_cluster_macros(markdown_content, current_page_slug, **kwargs):
+    if '~~CLUSTER_' not in markdown_content: return markdown_content
     app_instance = kwargs.get('app_context', current_app)
-    
-    if '~~CLUSTER_MEMBERS~~' in markdown_content:
-        cluster_data = load_cluster_data(app_instance)
-        page_to_cluster = cluster_data.get('page_to_cluster', {})
-        current_cluster_id = page_to_cluster.get(current_page_slug)
-        replacement_md = ""
-        if current_cluster_id is not None:
-            cluster_members = cluster_data.get('clusters', {}).get(current_cluster_id, [])
-            list_items = [f"* [[{ps}|{ps.replace('/', ' / ').replace('-', ' ').title()}]]" 
-                          for ps in sorted(cluster_members) if ps != current_page_slug]
-            replacement_md = "\n".join(list_items) if list_items else "*No other pages found in this cluster.*"
-        else:
-            replacement_md = '*This page has not been clustered yet.*'
-        markdown_content = markdown_content.replace('~~CLUSTER_MEMBERS~~', replacement_md)
 
-    if '~~CLUSTER_LIST~~' in markdown_content:
-        full_list_md = generate_full_cluster_list(app_instance)
-        markdown_content = markdown_content.replace('~~CLUSTER_LIST~~', full_list_md)
+    # One scan for both macros; each replacement is built on first use only.
+    rendered = {}
+    def replace_macro(match):
+        macro = match.group(1)
+        if macro not in rendered:
+            if macro == 'CLUSTER_MEMBERS':
+                rendered[macro] = generate_cluster_members_list(app_instance, current_page_slug)
+            else:
+                rendered[macro] = generate_full_cluster_list(app_instance)
+        return rendered[macro]
 
-    return markdown_content
+    return CLUSTER_MACRO_RE.sub(replace_macro, markdown_content)
 
 # --- Plugin Registration ---
 def register(app, register_hook):
     app.register_blueprint(cluster_bp)
     register_hook('process_page_macros', process_cluster_macros)
 
-    if not os.path.exists(get_config_path(app)):
-        save_config(app, {'num_clusters': 5, 'num_top_terms': 3})
-    if not os.path.exists(get_cluster_data_path(app)):
-        with open(get_cluster_data_path(app), 'w') as f:
-            json.dump({'clusters': {}, 'page_to_cluster': {}, 'cluster_names': {}}, f)
+    create_default_file(get_config_path(app), {'num_clusters': 5, 'num_top_terms': 3})
+    create_default_file(get_cluster_data_path(app), {'clusters': {}, 'page_to_cluster': {}, 'cluster_names': {}, 'display_names': {}},
+                        encode=_encode_json_compact)
 
-    app.logger.info("Cluster Naming plugin registered.")
+    app.logger.info(f"Cluster Naming plugin registered (sklearnex KMeans {'enabled' if SKLEARNEX_PATCHED else 'not installed'}).")
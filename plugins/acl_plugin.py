@@ -2,9 +2,20 @@
 
 import os
 import json
-from flask import g, flash, redirect, url_for, request, session, abort # Added request, session, abort
+from collections import defaultdict
+from flask import g, flash, redirect, url_for, request, session, abort, has_request_context # Added request, session, abort
 from functools import wraps
 
+# orjson parses and serializes several times faster than the json module; it only offers
+# 2-space indentation, which is fine for these hand-editable files.
+try:
+    import orjson
+    _decode_json = orjson.loads
+    def _encode_json(data): return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+except ImportError:
+    _decode_json = json.loads
+    def _encode_json(data): return json.dumps(data, indent=4, ensure_ascii=False).encode('utf-8')
+
 # --- Configuration ---
 CONFIG_FILENAME = "acl_config.json"  # Stores admin_users, default_permissions
 GROUPS_FILENAME = "acl_groups.json"  # Stores user-to-group memberships for custom groups
@@ -31,75 +42,137 @@ ACTIONS_TO_REQUIRED_LEVEL = {
     "admin_site": PERMISSION_LEVELS["admin"] # For accessing admin interfaces
 }
 
+# Used when acl_config.json is missing. Module-level so an unchanged fallback doesn't
+# invalidate the permission index below.
+FALLBACK_CONFIG = {"admin_users": [],
+                   "default_permissions": {"anonymous": "read", "authenticated": "read"}}
+EMPTY_DATA = {}
+
 # --- Helper Functions for Data File Management ---
 def get_data_file_path(app_instance, filename):
     data_dir = app_instance.config.get('DATA_DIR', os.path.join(app_instance.root_path, 'data'))
     return os.path.join(data_dir, filename)
 
+# Parsed data files keyed by path -> (st_mtime_ns, data). Permission checks run several
+# times per request, so files are only re-read when their mtime changes.
+# Callers must treat the returned data as read-only.
+_ACL_CACHE = {}
+
 def load_json_data(app_instance, filename, default_data=None):
+    """Returns the parsed file, checking its mtime at most once per request."""
+    if not has_request_context():
+        return _load_json_file(app_instance, filename, default_data)
+    request_cache = g.setdefault('_acl_cache', {})
+    data = request_cache.get(filename)
+    if data is None:
+        data = request_cache[filename] = _load_json_file(app_instance, filename, default_data)
+    return data
+
+def _load_json_file(app_instance, filename, default_data=None):
     if default_data is None: default_data = {}
     file_path = get_data_file_path(app_instance, filename)
-    if os.path.exists(file_path):
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except json.JSONDecodeError:
-            app_instance.logger.error(f"ACLPlugin: Error decoding JSON from {file_path}")
-        except Exception as e:
-            app_instance.logger.error(f"ACLPlugin: Error loading {file_path}: {e}")
+    try:
+        mtime_ns = os.stat(file_path).st_mtime_ns
+    except OSError:
+        return default_data
+    cached = _ACL_CACHE.get(file_path)
+    if cached is not None and cached[0] == mtime_ns:
+        return cached[1]
+    try:
+        with open(file_path, 'rb') as f:
+            data = _decode_json(f.read())
+        _ACL_CACHE[file_path] = (mtime_ns, data)
+        return data
+    except json.JSONDecodeError:
+        app_instance.logger.error(f"ACLPlugin: Error decoding JSON from {file_path}")
+    except Exception as e:
+        app_instance.logger.error(f"ACLPlugin: Error loading {file_path}: {e}")
     return default_data
 
 def save_json_data(app_instance, filename, data):
     file_path = get_data_file_path(app_instance, filename)
     try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=4, ensure_ascii=False)
+        with open(file_path, 'wb') as f:
+            f.write(_encode_json(data))
         app_instance.logger.info(f"ACLPlugin: Data saved to {file_path}")
     except Exception as e:
         app_instance.logger.error(f"ACLPlugin: Error saving data to {file_path}: {e}")
 
+def create_json_data_file(app_instance, filename, default_content):
+    """Writes default_content unless the file already exists; O_EXCL makes the check and the create one step."""
+    file_path = get_data_file_path(app_instance, filename)
+    try:
+        fd = os.open(file_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+    except FileExistsError:
+        return False
+    except OSError as e:
+        app_instance.logger.error(f"ACLPlugin: Error creating {file_path}: {e}")
+        return False
+    with os.fdopen(fd, 'wb') as f:
+        f.write(_encode_json(default_content))
+    app_instance.logger.info(f"ACLPlugin: Data file '{filename}' not found. Created with defaults.")
+    return True
+
 # --- Core Permission Checking Logic ---
+# (source objects, index). load_json_data hands back the same objects while the files are
+# unchanged, so an identity check is enough to tell whether the index is still current.
+_ACL_INDEX = {}
+
+def build_acl_index(config, groups_data, group_permissions):
+    """Inverts group memberships and maps every permission string to its level once."""
+    none_level = PERMISSION_LEVELS["none"]
+    user_to_groups = defaultdict(set)
+    for group_name, members in groups_data.items():
+        for member in members:
+            user_to_groups[member].add(group_name)
+    default_permissions = config.get("default_permissions", {})
+    return {
+        "admin_users": frozenset(config.get("admin_users", [])),
+        "user_to_groups": {user: frozenset(groups) for user, groups in user_to_groups.items()},
+        "group_levels": {group: PERMISSION_LEVELS.get(level_str, none_level)
+                         for group, level_str in group_permissions.items()},
+        "anonymous_level": PERMISSION_LEVELS.get(default_permissions.get("anonymous", "none"), none_level),
+        "authenticated_level": PERMISSION_LEVELS.get(default_permissions.get("authenticated", "none"), none_level),
+        "user_levels": {}, # username -> level, filled on demand
+    }
+
+def get_acl_index(app_instance):
+    sources = (load_json_data(app_instance, CONFIG_FILENAME, default_data=FALLBACK_CONFIG),
+               load_json_data(app_instance, GROUPS_FILENAME, default_data=EMPTY_DATA),
+               load_json_data(app_instance, GROUP_PERMISSIONS_FILENAME, default_data=EMPTY_DATA))
+    cached = _ACL_INDEX.get('entry')
+    if cached is not None and all(a is b for a, b in zip(cached[0], sources)):
+        return cached[1]
+    index = build_acl_index(*sources)
+    _ACL_INDEX['entry'] = (sources, index)
+    return index
+
 def get_user_effective_permission_level(app_instance, username):
     """
     Determines the highest permission level for a user based on their group memberships.
     """
-    config = load_json_data(app_instance, CONFIG_FILENAME,
-                            default_data={"admin_users": [], 
-                                          "default_permissions": {"anonymous": "read", "authenticated": "read"}})
-    groups_data = load_json_data(app_instance, GROUPS_FILENAME, default_data={})
-    group_permissions = load_json_data(app_instance, GROUP_PERMISSIONS_FILENAME, default_data={})
+    index = get_acl_index(app_instance)
+    # Templates check several actions per page for the same user. Levels live in the index,
+    # so they are dropped together with it when an ACL file changes.
+    user_levels = index["user_levels"]
+    level = user_levels.get(username)
+    if level is None:
+        level = user_levels[username] = _compute_permission_level(index, username)
+    return level
 
+def _compute_permission_level(index, username):
     # 1. Super Admin check (overrides everything)
-    if username and username in config.get("admin_users", []):
+    if username and username in index["admin_users"]:
         return PERMISSION_LEVELS["admin"]
 
-    user_groups = set()
-    if username:
-        user_groups.add("authenticated") # All logged-in users are in this implicit group
-        for group_name, members in groups_data.items():
-            if username in members:
-                user_groups.add(group_name)
-    else:
-        user_groups.add("anonymous") # Non-logged-in users
-
-    max_level = PERMISSION_LEVELS["none"]
-
-    # Check permissions from default "anonymous" or "authenticated" groups
-    if "anonymous" in user_groups:
-        level_str = config.get("default_permissions", {}).get("anonymous", "none")
-        max_level = max(max_level, PERMISSION_LEVELS.get(level_str, PERMISSION_LEVELS["none"]))
-    
-    if "authenticated" in user_groups:
-        level_str = config.get("default_permissions", {}).get("authenticated", "none")
-        max_level = max(max_level, PERMISSION_LEVELS.get(level_str, PERMISSION_LEVELS["none"]))
-
-    # Check permissions from custom groups
-    for group in user_groups:
-        if group in group_permissions: # Check custom group permissions
-            level_str = group_permissions[group]
-            max_level = max(max_level, PERMISSION_LEVELS.get(level_str, PERMISSION_LEVELS["none"]))
-            
-    return max_level
+    group_levels = index["group_levels"]
+    none_level = PERMISSION_LEVELS["none"]
+    if not username: # Non-logged-in users
+        return max(index["anonymous_level"], group_levels.get("anonymous", none_level))
+
+    # All logged-in users are in the implicit "authenticated" group
+    user_groups = index["user_to_groups"].get(username, frozenset()) | {"authenticated"}
+    return max(index["authenticated_level"], max(group_levels.get(group, none_level) for group in user_groups))
 
 def check_permission(app_instance, username, required_action, resource_path=None): # resource_path is ignored in simple ACL
     """Checks if a user has permission for a specific action (globally)."""
@@ -196,10 +269,7 @@ def register(app_instance, register_hook_func):
         (GROUPS_FILENAME, default_groups),
         (GROUP_PERMISSIONS_FILENAME, default_group_permissions)
     ]:
-        file_path = get_data_file_path(app_instance, filename)
-        if not os.path.exists(file_path):
-            app_instance.logger.info(f"ACLPlugin: Data file '{filename}' not found. Creating with defaults.")
-            save_json_data(app_instance, filename, default_content)
+        create_json_data_file(app_instance, filename, default_content)
     
     app_instance.logger.info("ACL plugin registered and hooks set.")
 
@@ -1,15 +1,30 @@
 # pandoky/plugins/admin_acl_editor_plugin.py
 
 import os
+import copy
 import json
 import re
+import tempfile
+import threading
 from flask import (
     Blueprint, render_template, request, redirect, url_for,
-    flash, g, current_app, session, abort
+    flash, g, current_app, session, abort, has_request_context, jsonify
 )
 from werkzeug.security import generate_password_hash # For admin user creation
 from functools import wraps
+from dataclasses import dataclass
 import sys
+from types import MappingProxyType
+from concurrent.futures import ThreadPoolExecutor
+
+# Same optional orjson fast path as acl_plugin; these files are small but read on every admin view.
+try:
+    import orjson
+    _decode_json = orjson.loads
+    def _encode_json(data): return orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+except ImportError:
+    _decode_json = json.loads
+    def _encode_json(data): return json.dumps(data, indent=4, ensure_ascii=False, sort_keys=True).encode('utf-8')
 
 # --- Attempt to import from the main acl_plugin ---
 ACL_LOGIC_PLUGIN_IMPORTED_SUCCESSFULLY = False
@@ -28,7 +43,8 @@ try:
     GROUPS_FILENAME = MAIN_GROUPS_FILENAME 
     # Ensure GROUP_PERMISSIONS_FILENAME is defined if used by this plugin's logic later
     GROUP_PERMISSIONS_FILENAME = getattr(sys.modules['plugins.acl_plugin'], 'GROUP_PERMISSIONS_FILENAME', "acl_group_permissions.json") # Default if not in acl_plugin
-    #ACL_RULES_FILENAME = MAIN_ACL_RULES_FILENAME
+    # acl_plugin has no path rules file yet; fall back to the conventional name if it doesn't define one
+    ACL_RULES_FILENAME = getattr(sys.modules['plugins.acl_plugin'], 'ACL_RULES_FILENAME', "acl_rules.json")
 
 
 except ImportError as e:
@@ -36,7 +52,7 @@ except ImportError as e:
     PERMISSION_LEVELS = {"admin": 5, "read": 1, "none": 0, "edit": 2, "create": 3, "delete": 4} 
     CONFIG_FILENAME = "acl_config.json" 
     GROUPS_FILENAME = "acl_groups.json" 
-    #ACL_RULES_FILENAME = "acl_rules.json" 
+    ACL_RULES_FILENAME = "acl_rules.json" 
     GROUP_PERMISSIONS_FILENAME = "acl_group_permissions.json" # Fallback
 
     def main_acl_check_permission(app_instance, username, required_action, resource_path=None):
@@ -49,7 +65,24 @@ except ImportError as e:
 ADMIN_ACL_EDITOR_BLUEPRINT_NAME = 'admin_acl_editor_plugin'
 # User data file configuration (should match auth_plugin.py) for admin user creation
 AUTH_USERS_FILENAME = "auth_users.json" # From auth_plugin.py
-AUTH_DEFAULT_HASH_METHOD = 'pbkdf2:sha256' # From auth_plugin.py
+# Admin-created users are hashed exactly like self-registered ones, and the users file is
+# written in auth_plugin's format so it doesn't flip layout depending on who saved it last.
+try:
+    from plugins.auth_plugin import DEFAULT_HASH_METHOD as AUTH_DEFAULT_HASH_METHOD, encode_users
+except ImportError as e:
+    print(f"AdminACLEditorPlugin: WARNING - Could not import from auth_plugin: {e}. New users get werkzeug's default hash method.")
+    AUTH_DEFAULT_HASH_METHOD = None
+    def encode_users(users_data): return json.dumps(users_data, indent=4, ensure_ascii=False).encode('utf-8') # As auth_plugin's
+# Files this editor writes in another plugin's format
+FILE_ENCODERS = {AUTH_USERS_FILENAME: encode_users}
+
+# How many users' admin_site decisions are remembered
+ADMIN_DECISION_CACHE_SIZE = 1024
+
+# Form validators
+GROUP_NAME_RE = re.compile(r"^[a-zA-Z0-9_-]+$")
+COMMA_SPLIT_RE = re.compile(r"\s*,\s*") # Splits and strips a comma-separated list in one pass
+EMAIL_RE = re.compile(r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$")
 
 
 # --- Blueprint Definition ---
@@ -65,31 +98,205 @@ def get_data_file_path(app_instance, filename):
     data_dir = app_instance.config.get('DATA_DIR', os.path.join(app_instance.root_path, 'data'))
     return os.path.join(data_dir, filename)
 
-def load_json_data(app_instance, filename, default_data=None):
+# Parsed data files keyed by path -> (st_mtime_ns, st_size, data, frozen view of data),
+# re-read only when the file changes. Readers share the frozen view; handlers that edit
+# ask for a mutable copy.
+_JSON_CACHE = {}
+# file_path -> counter bumped whenever the cached copy of that file is replaced (re-read or
+# saved here). Caches built from a file remember the version they saw, so a save in this
+# process invalidates them even when the new mtime/size can't be told apart from the old.
+_FILE_VERSION = {}
+
+def _bump_file_version(file_path):
+    _FILE_VERSION[file_path] = _FILE_VERSION.get(file_path, 0) + 1
+
+def _freeze(obj):
+    """Read-only view of parsed JSON: dicts become MappingProxyType, lists become tuples."""
+    if isinstance(obj, dict):
+        return MappingProxyType({key: _freeze(value) for key, value in obj.items()})
+    if isinstance(obj, list):
+        return tuple(_freeze(value) for value in obj)
+    return obj
+
+def _request_cache():
+    """Working copies of the data files for the current request (g is fresh per request)."""
+    return g.setdefault('_acl_json_cache', {}) if has_request_context() else None
+
+def load_json_data(app_instance, filename, default_data=None, mutable=False):
+    """
+    Returns a read-only view of the file, or with mutable=True a working copy to edit and
+    save. Within a request every helper gets the same working copy, so a handler that
+    touches several files (or one file twice) copies each only once.
+    """
+    request_cache = _request_cache()
+    if request_cache is not None and filename in request_cache:
+        return request_cache[filename]
     if default_data is None: default_data = {}
     file_path = get_data_file_path(app_instance, filename)
-    if os.path.exists(file_path):
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        return default_data
+    cached = _JSON_CACHE.get(file_path)
+    if cached is None or cached[0] != st.st_mtime_ns or cached[1] != st.st_size:
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            with open(file_path, 'rb') as f:
+                data = _decode_json(f.read())
         except json.JSONDecodeError:
             app_instance.logger.error(f"AdminACLEditorPlugin: Error decoding JSON from {file_path}")
+            return default_data
         except Exception as e:
             app_instance.logger.error(f"AdminACLEditorPlugin: Error loading {file_path}: {e}")
-    return default_data
+            return default_data
+        cached = _JSON_CACHE[file_path] = (st.st_mtime_ns, st.st_size, data, _freeze(data))
+        _bump_file_version(file_path)
+    if not mutable:
+        return cached[3]
+    data = copy.deepcopy(cached[2])
+    if request_cache is not None:
+        request_cache[filename] = data
+    return data
+
+def _stage_json_file(file_path, data, encode=_encode_json):
+    """Writes data to a fsynced temp file next to file_path and returns the temp path."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(file_path),
+                                    prefix='.' + os.path.basename(file_path) + '.', suffix='.tmp')
+    try:
+        os.fchmod(fd, 0o644) # mkstemp creates 0600; keep the mode a plain open() would give
+        os.write(fd, encode(data))
+        os.fsync(fd)
+    except BaseException:
+        os.close(fd)
+        os.unlink(tmp_path)
+        raise
+    os.close(fd)
+    return tmp_path
+
+def save_json_files(app_instance, files):
+    """
+    Saves [(filename, data), ...] as a group: every file is staged to a temp file first and
+    only then moved into place, so a failure while writing leaves all targets untouched.
+    Returns the filenames that could not be saved.
+    """
+    staged = []
+    try:
+        for filename, data in files:
+            file_path = get_data_file_path(app_instance, filename)
+            staged.append((filename, file_path, _stage_json_file(file_path, data, FILE_ENCODERS.get(filename, _encode_json)), data))
+    except Exception as e:
+        app_instance.logger.error(f"AdminACLEditorPlugin: Error writing {filename}: {e}. Nothing was saved.")
+        for _, _, tmp_path, _ in staged:
+            try: os.unlink(tmp_path)
+            except OSError: pass
+        return [filename for filename, _ in files]
+
+    failed = []
+    request_cache = _request_cache()
+    for filename, file_path, tmp_path, data in staged:
+        try:
+            os.replace(tmp_path, file_path)
+        except OSError as e:
+            app_instance.logger.error(f"AdminACLEditorPlugin: Error saving data to {file_path}: {e}")
+            try: os.unlink(tmp_path)
+            except OSError: pass
+            failed.append(filename)
+            continue
+        st = os.stat(file_path)
+        saved = copy.deepcopy(data)
+        _JSON_CACHE[file_path] = (st.st_mtime_ns, st.st_size, saved, _freeze(saved))
+        _bump_file_version(file_path)
+        if request_cache is not None:
+            request_cache[filename] = data
+        app_instance.logger.info(f"AdminACLEditorPlugin: Data saved to {file_path}")
+    return failed
 
 def save_json_data(app_instance, filename, data):
+    """Writes through a temp file in the same directory, so readers never see a partial file."""
+    return not save_json_files(app_instance, [(filename, data)])
+
+def mutate_json_data(app_instance, filename, mutator, default_data=None):
+    """
+    Loads a working copy of filename, applies mutator(data) and saves it unless mutator
+    returns False. Returns (saved, data); the saved data also becomes the cached copy, so the
+    page the handler redirects to is served without parsing the file again.
+    """
+    data = load_json_data(app_instance, filename, default_data, mutable=True)
+    if mutator(data) is False:
+        return False, None
+    if save_json_data(app_instance, filename, data):
+        return True, data
+    return False, None
+
+# Lookup tables derived from a cached data file: (file_path, builder) -> (file version, index).
+# An index is rebuilt only after the file it came from changes.
+_DERIVED_INDEXES = {}
+
+def get_derived_index(app_instance, filename, builder):
+    """Call after loading filename; builds (or reuses) builder(data) for the cached copy."""
     file_path = get_data_file_path(app_instance, filename)
-    try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=4, ensure_ascii=False)
-        app_instance.logger.info(f"AdminACLEditorPlugin: Data saved to {file_path}")
-        return True
-    except Exception as e:
-        app_instance.logger.error(f"AdminACLEditorPlugin: Error saving data to {file_path}: {e}")
-        return False
+    entry = _JSON_CACHE.get(file_path)
+    if entry is None: return builder({})
+    cached = _DERIVED_INDEXES.get((file_path, builder))
+    version = _FILE_VERSION.get(file_path, 0)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    index = builder(entry[2])
+    _DERIVED_INDEXES[(file_path, builder)] = (version, index)
+    return index
+
+def build_email_index(users_data):
+    """email -> username"""
+    return {data['email']: username for username, data in users_data.items() if data.get('email')}
+
+def build_rules_index(acl_rules):
+    """{'users': name -> [rule paths], 'groups': name -> [rule paths]} for acl_rules' path_permissions."""
+    users_to_paths = {}
+    groups_to_paths = {}
+    for path, path_rule in acl_rules.get("path_permissions", {}).items():
+        for username in path_rule.get("users", {}):
+            users_to_paths.setdefault(username, []).append(path)
+        for group_name in path_rule.get("groups", {}):
+            groups_to_paths.setdefault(group_name, []).append(path)
+    return {"users": users_to_paths, "groups": groups_to_paths}
+
+def get_email_index(app_instance):
+    return get_derived_index(app_instance, AUTH_USERS_FILENAME, build_email_index)
+
+def hash_password(password):
+    if AUTH_DEFAULT_HASH_METHOD is None:
+        return generate_password_hash(password)
+    return generate_password_hash(password, method=AUTH_DEFAULT_HASH_METHOD)
 
 # --- Route Protection Helper ---
+# username -> (expires_at, allowed). Repeated hits on the admin area, including repeated
+# denials, skip the ACL lookup for a few seconds. Saving any file that can change the
+# decision clears it, so only hand edits wait out the TTL.
+_ADMIN_DECISION_CACHE = {}
+ACL_DECISION_FILES = tuple(filename for filename in (CONFIG_FILENAME, GROUPS_FILENAME, GROUP_PERMISSIONS_FILENAME) if filename)
+
+def _acl_files_state(app_instance):
+    """st_mtime_ns of each file the decision is based on (None if missing), as acl_plugin keys its cache."""
+    state = []
+    for filename in ACL_DECISION_FILES:
+        try:
+            state.append(os.stat(get_data_file_path(app_instance, filename)).st_mtime_ns)
+        except OSError:
+            state.append(None)
+    return tuple(state)
+
+def check_admin_permission(app_instance, username):
+    # Keyed on the ACL files' mtimes rather than a TTL, so a grant revoked by any worker
+    # (or by hand) stops working on the next request everywhere.
+    files_state = _acl_files_state(app_instance)
+    cached = _ADMIN_DECISION_CACHE.get(username)
+    if cached is not None and cached[0] == files_state:
+        return cached[1]
+    allowed = main_acl_check_permission(app_instance, username, "admin_site", resource_path="SITE_ADMIN_ACL_EDITOR")
+    if len(_ADMIN_DECISION_CACHE) >= ADMIN_DECISION_CACHE_SIZE:
+        _ADMIN_DECISION_CACHE.clear()
+    _ADMIN_DECISION_CACHE[username] = (files_state, allowed)
+    return allowed
+
 def admin_required_for_acl_editor(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -103,7 +310,7 @@ def admin_required_for_acl_editor(f):
         current_user = getattr(g, 'current_user', None) 
         app_instance.logger.debug(f"AdminACLEditorPlugin: admin_required checking user '{current_user}' for 'admin_site'.")
 
-        if not main_acl_check_permission(app_instance, current_user, "admin_site", resource_path="SITE_ADMIN_ACL_EDITOR"):
+        if not check_admin_permission(app_instance, current_user):
             app_instance.logger.warning(f"AdminACLEditorPlugin: Permission DENIED for user '{current_user}' to 'admin_site'.")
             flash("You do not have permission to access this admin area.", "error")
             if current_user is None:
@@ -125,7 +332,7 @@ def dashboard():
     # Check if GROUP_PERMISSIONS_FILENAME is defined and used by the simple_acl_plugin
     # If your simple_acl_plugin only uses acl_rules.json for group permissions, adjust this
     group_permissions_data = {}
-    if 'GROUP_PERMISSIONS_FILENAME' in globals() and GROUP_PERMISSIONS_FILENAME: # Check if constant is defined
+    if GROUP_PERMISSIONS_FILENAME:
         group_permissions_data = load_json_data(app_instance, GROUP_PERMISSIONS_FILENAME)
 
     return render_template(
@@ -148,18 +355,19 @@ def edit_config():
             default_anon_perm = request.form.get('default_anonymous', 'none')
             default_auth_perm = request.form.get('default_authenticated', 'none')
 
-            admin_users = sorted(list(set([user.strip() for user in admin_users_str.split(',') if user.strip()])))
+            admin_users = sorted({user for user in COMMA_SPLIT_RE.split(admin_users_str.strip()) if user})
             
             if default_anon_perm not in PERMISSION_LEVELS or default_auth_perm not in PERMISSION_LEVELS:
                 flash("Invalid permission level selected for defaults.", "error")
             else:
-                current_config = load_json_data(app_instance, CONFIG_FILENAME)
-                current_config['admin_users'] = admin_users
-                current_config['default_permissions'] = {
-                    'anonymous': default_anon_perm,
-                    'authenticated': default_auth_perm
-                }
-                if save_json_data(app_instance, CONFIG_FILENAME, current_config):
+                def apply_config(current_config):
+                    current_config['admin_users'] = admin_users
+                    current_config['default_permissions'] = {
+                        'anonymous': default_anon_perm,
+                        'authenticated': default_auth_perm
+                    }
+                saved, _ = mutate_json_data(app_instance, CONFIG_FILENAME, apply_config)
+                if saved:
                     flash("ACL site configuration saved successfully.", "success")
                 else:
                     flash("Failed to save ACL site configuration.", "error")
@@ -180,7 +388,7 @@ def edit_config():
 @admin_required_for_acl_editor
 def manage_groups():
     app_instance = g.app
-    groups_data = load_json_data(app_instance, GROUPS_FILENAME, default_data={})
+    groups_data = load_json_data(app_instance, GROUPS_FILENAME, default_data={}, mutable=request.method == 'POST')
 
     if request.method == 'POST':
         action = request.form.get('action')
@@ -189,49 +397,64 @@ def manage_groups():
             new_group_name = request.form.get('new_group_name', '').strip()
             if not new_group_name:
                 flash("Group name cannot be empty.", "error")
-            elif not re.match(r"^[a-zA-Z0-9_-]+$", new_group_name):
+            elif not GROUP_NAME_RE.match(new_group_name):
                 flash("Group name can only contain letters, numbers, underscores, and hyphens.", "error")
             elif new_group_name in groups_data or new_group_name in ["anonymous", "authenticated"]:
                 flash(f"Group name '{new_group_name}' is reserved or already exists.", "error")
             else:
-                groups_data[new_group_name] = [] 
-                if save_json_data(app_instance, GROUPS_FILENAME, groups_data):
+                saved, _ = mutate_json_data(app_instance, GROUPS_FILENAME,
+                                            lambda groups: groups.update({new_group_name: []}))
+                if saved:
                     flash(f"Group '{new_group_name}' created successfully.", "success")
                 else:
                     flash(f"Failed to create group '{new_group_name}'.", "error")
                 return redirect(url_for('.manage_groups'))
         
         elif action == "delete_group":
-            group_to_delete = request.form.get('group_to_delete', '').strip()
-            if group_to_delete and group_to_delete in groups_data:
+            # Accepts one or several group_to_delete values; all of them are cleaned up in
+            # a single pass over each file and each file is saved once.
+            requested = [name for name in dict.fromkeys(name.strip() for name in request.form.getlist('group_to_delete')) if name]
+            groups_to_delete = {name for name in requested if name in groups_data}
+            not_found = [name for name in requested if name not in groups_to_delete]
+            if groups_to_delete:
+                pending_saves = []
                 # Remove from simple_acl_group_permissions.json if it exists and is used
-                if 'GROUP_PERMISSIONS_FILENAME' in globals() and GROUP_PERMISSIONS_FILENAME:
-                    group_permissions_data = load_json_data(app_instance, GROUP_PERMISSIONS_FILENAME)
-                    if group_to_delete in group_permissions_data:
-                        del group_permissions_data[group_to_delete]
-                        save_json_data(app_instance, GROUP_PERMISSIONS_FILENAME, group_permissions_data)
+                if GROUP_PERMISSIONS_FILENAME:
+                    group_permissions_data = load_json_data(app_instance, GROUP_PERMISSIONS_FILENAME, mutable=True)
+                    if not groups_to_delete.isdisjoint(group_permissions_data):
+                        for name in groups_to_delete & group_permissions_data.keys():
+                            del group_permissions_data[name]
+                        pending_saves.append((GROUP_PERMISSIONS_FILENAME, group_permissions_data))
                 
                 # Also check and remove from complex acl_rules.json if that file is being managed
-                acl_rules = load_json_data(app_instance, ACL_RULES_FILENAME, default_data={})
-                rules_modified = False
-                if group_to_delete in acl_rules.get("global_permissions", {}).get("groups", {}):
-                    del acl_rules["global_permissions"]["groups"][group_to_delete]
-                    rules_modified = True
-                for path_rule in acl_rules.get("path_permissions", {}).values():
-                    if group_to_delete in path_rule.get("groups", {}):
-                        del path_rule["groups"][group_to_delete]
+                if ACL_RULES_FILENAME:
+                    acl_rules = load_json_data(app_instance, ACL_RULES_FILENAME, default_data={}, mutable=True)
+                    rules_modified = False
+                    global_groups = acl_rules.get("global_permissions", {}).get("groups", {})
+                    for name in groups_to_delete & global_groups.keys():
+                        del global_groups[name]
                         rules_modified = True
-                if rules_modified:
-                    save_json_data(app_instance, ACL_RULES_FILENAME, acl_rules)
-
-
-                del groups_data[group_to_delete]
-                if save_json_data(app_instance, GROUPS_FILENAME, groups_data):
-                    flash(f"Group '{group_to_delete}' deleted successfully.", "success")
+                    path_permissions = acl_rules.get("path_permissions", {})
+                    rules_by_group = get_derived_index(app_instance, ACL_RULES_FILENAME, build_rules_index)["groups"]
+                    affected_paths = {path for name in groups_to_delete for path in rules_by_group.get(name, ())}
+                    for path in affected_paths:
+                        path_groups = path_permissions.get(path, {}).get("groups", {})
+                        for name in groups_to_delete & path_groups.keys():
+                            del path_groups[name]
+                            rules_modified = True
+                    if rules_modified:
+                        pending_saves.append((ACL_RULES_FILENAME, acl_rules))
+
+                for name in groups_to_delete:
+                    del groups_data[name]
+                pending_saves.append((GROUPS_FILENAME, groups_data))
+                deleted_names = ', '.join(f"'{name}'" for name in requested if name in groups_to_delete)
+                if GROUPS_FILENAME in save_json_files(app_instance, pending_saves):
+                    flash(f"Failed to delete group(s) {deleted_names}.", "error")
                 else:
-                    flash(f"Failed to delete group '{group_to_delete}'.", "error")
-            else:
-                flash(f"Group '{group_to_delete}' not found for deletion.", "error")
+                    flash(f"Group(s) {deleted_names} deleted successfully.", "success")
+            if not_found or not requested:
+                flash(f"Group '{', '.join(not_found)}' not found for deletion.", "error")
             return redirect(url_for('.manage_groups'))
 
     return render_template('manage_groups.html', title="Manage User Groups", groups_data=groups_data) 
@@ -248,11 +471,11 @@ def edit_group_members(group_name):
 
     if request.method == 'POST':
         members_str = request.form.get('members', '')
-        members_list = sorted(list(set([member.strip() for member in members_str.split(',') if member.strip()])))
-        
-        groups_data[group_name] = members_list
+        members_list = sorted({member for member in COMMA_SPLIT_RE.split(members_str.strip()) if member})
         
-        if save_json_data(app_instance, GROUPS_FILENAME, groups_data):
+        saved, _ = mutate_json_data(app_instance, GROUPS_FILENAME,
+                                    lambda groups: groups.update({group_name: members_list}))
+        if saved:
             flash(f"Members of group '{group_name}' updated successfully.", "success")
         else:
             flash(f"Failed to update members for group '{group_name}'.", "error")
@@ -270,7 +493,7 @@ def manage_group_permissions():
     app_instance = g.app
     # This route manages the GROUP_PERMISSIONS_FILENAME for the simple ACL model
     group_permissions_data = {}
-    if 'GROUP_PERMISSIONS_FILENAME' in globals() and GROUP_PERMISSIONS_FILENAME:
+    if GROUP_PERMISSIONS_FILENAME:
         group_permissions_data = load_json_data(app_instance, GROUP_PERMISSIONS_FILENAME, default_data={})
     else:
         flash("Group permissions file configuration is missing. This section might not work as expected.", "warning")
@@ -288,11 +511,12 @@ def manage_group_permissions():
             flash(f"Group '{group_to_set}' does not exist.", "error")
         elif permission_level not in PERMISSION_LEVELS: 
             flash(f"Invalid permission level '{permission_level}'.", "error")
-        elif 'GROUP_PERMISSIONS_FILENAME' not in globals() or not GROUP_PERMISSIONS_FILENAME:
+        elif not GROUP_PERMISSIONS_FILENAME:
              flash("Cannot save group permissions: configuration missing.", "error")
         else:
-            group_permissions_data[group_to_set] = permission_level
-            if save_json_data(app_instance, GROUP_PERMISSIONS_FILENAME, group_permissions_data):
+            saved, _ = mutate_json_data(app_instance, GROUP_PERMISSIONS_FILENAME,
+                                        lambda permissions: permissions.update({group_to_set: permission_level}))
+            if saved:
                 flash(f"Permission for group '{group_to_set}' set to '{permission_level}'.", "success")
             else:
                 flash(f"Failed to set permission for group '{group_to_set}'.", "error")
@@ -308,6 +532,28 @@ def manage_group_permissions():
 
 
 
+# A full TF-IDF recalculation can take minutes, so it runs on a single background worker
+# (one run at a time) instead of holding the request open.
+_TFIDF_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix='tfidf-recalc')
+_TFIDF_STATUS = {"state": "idle", "error": None}
+# Guards _TFIDF_FUTURE and _TFIDF_STATUS, so two clicks can't both start a run
+_TFIDF_LOCK = threading.Lock()
+_TFIDF_FUTURE = None
+
+def _run_tfidf_recalculation(app_instance):
+    with app_instance.app_context():
+        app_instance.recalculate_all_tfidf()
+
+def _tfidf_recalculation_done(future, app_instance):
+    error = future.exception()
+    with _TFIDF_LOCK:
+        if future is _TFIDF_FUTURE:
+            _TFIDF_STATUS.update(state="done" if error is None else "error", error=None if error is None else str(error))
+    if error is None:
+        app_instance.logger.info("AdminACLEditorPlugin: Background TF-IDF recalculation finished.")
+    else:
+        app_instance.logger.error(f"AdminACLEditorPlugin: Background TF-IDF recalculation failed: {error}", exc_info=error)
+
 @admin_acl_editor_bp.route('/tools/recalculate-tfidf', methods=['POST'])
 @admin_required_for_acl_editor 
 def trigger_recalculate_tfidf():
@@ -315,19 +561,49 @@ def trigger_recalculate_tfidf():
     app_instance.logger.info("AdminACLEditorPlugin: Received request to recalculate all TF-IDF vectors.")
     
     if hasattr(app_instance, 'recalculate_all_tfidf') and callable(app_instance.recalculate_all_tfidf):
-        try:
-            app_instance.recalculate_all_tfidf() 
-            flash("Full TF-IDF recalculation process initiated. Check server logs for progress.", "success")
-        except Exception as e:
-            app_instance.logger.error(f"AdminACLEditorPlugin: Error triggering TF-IDF recalculation: {e}", exc_info=True)
-            flash(f"Error triggering TF-IDF recalculation: {e}", "error")
+        global _TFIDF_FUTURE
+        with _TFIDF_LOCK:
+            future = None
+            if _TFIDF_FUTURE is None or _TFIDF_FUTURE.done():
+                future = _TFIDF_FUTURE = _TFIDF_EXECUTOR.submit(_run_tfidf_recalculation, app_instance)
+                _TFIDF_STATUS.update(state="running", error=None)
+        if future is None:
+            flash("A TF-IDF recalculation is already in progress.", "warning")
+        else:
+            # Attached outside the lock: a future that already finished runs the callback right here.
+            future.add_done_callback(lambda f: _tfidf_recalculation_done(f, app_instance))
+            flash("Full TF-IDF recalculation started in the background. Check server logs for progress.", "success")
     else:
         app_instance.logger.error("AdminACLEditorPlugin: 'recalculate_all_tfidf' function not found on app instance. Is the fulltext_indexer plugin loaded correctly and registered its method?")
         flash("'recalculate_all_tfidf' function not available. Indexer plugin might not be loaded or exposed its function correctly.", "error")
         
     return redirect(url_for('.dashboard'))
 
+@admin_acl_editor_bp.route('/tools/recalculate-tfidf/status', methods=['GET'])
+@admin_required_for_acl_editor
+def recalculate_tfidf_status():
+    with _TFIDF_LOCK:
+        return jsonify(dict(_TFIDF_STATUS))
+
 # --- User Management Routes (Admin) ---
+@dataclass
+class _UserForm:
+    """Fields of the admin 'add user' form, cleaned once as they are read."""
+    username: str
+    email: str
+    password: str
+    is_verified: bool
+
+    @classmethod
+    def from_request(cls):
+        form = request.form
+        return cls(
+            username=form.get('username', '').strip(),
+            email=form.get('email', '').strip().lower(),
+            password=form.get('password', ''),
+            is_verified=form.get('is_verified') == 'on'
+        )
+
 @admin_acl_editor_bp.route('/users', methods=['GET'])
 @admin_required_for_acl_editor
 def manage_users():
@@ -348,10 +624,8 @@ def manage_users():
 @admin_required_for_acl_editor
 def add_user_admin():
     app_instance = g.app
-    username = request.form.get('username', '').strip()
-    email = request.form.get('email', '').strip().lower()
-    password = request.form.get('password', '')
-    is_verified_admin = request.form.get('is_verified') == 'on' 
+    user_form = _UserForm.from_request()
+    username, email, password, is_verified_admin = user_form.username, user_form.email, user_form.password, user_form.is_verified
 
     if not username or not password or not email:
         flash("Username, email, and password are required to add a user.", "error")
@@ -361,22 +635,21 @@ def add_user_admin():
         flash("Username must be alphanumeric.", "error")
         return redirect(url_for('.manage_users'))
     
-    if not re.match(r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$", email):
+    if not EMAIL_RE.match(email):
         flash("Invalid email format.", "error")
         return redirect(url_for('.manage_users'))
 
-    auth_users_data = load_json_data(app_instance, AUTH_USERS_FILENAME, default_data={})
+    auth_users_data = load_json_data(app_instance, AUTH_USERS_FILENAME, default_data={}, mutable=True)
     if username in auth_users_data:
         flash(f"Username '{username}' already exists.", "error")
         return redirect(url_for('.manage_users'))
-    for u_data in auth_users_data.values():
-        if u_data.get('email') == email:
-            flash(f"Email '{email}' is already in use.", "error")
-            return redirect(url_for('.manage_users'))
+    if email in get_email_index(app_instance):
+        flash(f"Email '{email}' is already in use.", "error")
+        return redirect(url_for('.manage_users'))
 
     auth_users_data[username] = {
         "email": email,
-        "password_hash": generate_password_hash(password, method=AUTH_DEFAULT_HASH_METHOD),
+        "password_hash": hash_password(password),
         "is_verified": is_verified_admin, 
         "verification_token": None, 
         "verification_token_expiry": None,
@@ -401,46 +674,53 @@ def delete_user_admin(username_to_delete):
         flash("You cannot delete your own admin account.", "error")
         return redirect(url_for('.manage_users'))
 
-    auth_users_data = load_json_data(app_instance, AUTH_USERS_FILENAME, default_data={})
-    if username_to_delete in auth_users_data:
-        del auth_users_data[username_to_delete]
-        
-        acl_groups_data = load_json_data(app_instance, GROUPS_FILENAME, default_data={})
-        groups_modified = False
-        for group_name, members in acl_groups_data.items():
-            if username_to_delete in members:
-                members.remove(username_to_delete)
-                groups_modified = True
-        if groups_modified:
-            save_json_data(app_instance, GROUPS_FILENAME, acl_groups_data)
-
-        acl_config_data = load_json_data(app_instance, CONFIG_FILENAME, default_data={"admin_users":[]})
-        if username_to_delete in acl_config_data.get("admin_users", []):
-            acl_config_data["admin_users"].remove(username_to_delete)
-            save_json_data(app_instance, CONFIG_FILENAME, acl_config_data)
-        
-        # If using complex ACL rules, clean them too
-        if 'ACL_RULES_FILENAME' in globals() and ACL_RULES_FILENAME:
-            acl_rules_data = load_json_data(app_instance, ACL_RULES_FILENAME, default_data={"global_permissions":{}, "path_permissions":{}})
-            rules_modified = False
-            if username_to_delete in acl_rules_data.get("global_permissions",{}).get("users",{}):
-                del acl_rules_data["global_permissions"]["users"][username_to_delete]
-                rules_modified = True
-            for path_rules in acl_rules_data.get("path_permissions", {}).values():
-                if username_to_delete in path_rules.get("users",{}):
-                    del path_rules["users"][username_to_delete]
-                    rules_modified = True
-            if rules_modified:
-                 save_json_data(app_instance, ACL_RULES_FILENAME, acl_rules_data)
-
+    auth_users_data = load_json_data(app_instance, AUTH_USERS_FILENAME, default_data={}, mutable=True)
+    if username_to_delete not in auth_users_data:
+        flash(f"User '{username_to_delete}' not found.", "error")
+        return redirect(url_for('.manage_users'))
 
-        if save_json_data(app_instance, AUTH_USERS_FILENAME, auth_users_data):
-            flash(f"User '{username_to_delete}' and their associated ACL entries deleted successfully.", "success")
-            app_instance.logger.info(f"AdminACLEditorPlugin: Admin deleted user '{username_to_delete}'.")
-        else:
-            flash(f"Failed to fully delete user '{username_to_delete}' from auth file.", "error")
+    # Apply every change in memory first, then write the modified files together.
+    del auth_users_data[username_to_delete]
+    pending_saves = []
+
+    acl_groups_data = load_json_data(app_instance, GROUPS_FILENAME, default_data={}, mutable=True)
+    groups_modified = False
+    for group_name, members in acl_groups_data.items():
+        if username_to_delete in members:
+            members.remove(username_to_delete)
+            groups_modified = True
+    if groups_modified:
+        pending_saves.append((GROUPS_FILENAME, acl_groups_data))
+
+    acl_config_data = load_json_data(app_instance, CONFIG_FILENAME, default_data={"admin_users":[]}, mutable=True)
+    if username_to_delete in acl_config_data.get("admin_users", []):
+        acl_config_data["admin_users"].remove(username_to_delete)
+        pending_saves.append((CONFIG_FILENAME, acl_config_data))
+    
+    # If using complex ACL rules, clean them too
+    if ACL_RULES_FILENAME:
+        acl_rules_data = load_json_data(app_instance, ACL_RULES_FILENAME, default_data={"global_permissions":{}, "path_permissions":{}}, mutable=True)
+        rules_modified = False
+        if username_to_delete in acl_rules_data.get("global_permissions",{}).get("users",{}):
+            del acl_rules_data["global_permissions"]["users"][username_to_delete]
+            rules_modified = True
+        # Only visit the path rules that mention this user
+        path_permissions = acl_rules_data.get("path_permissions", {})
+        for path in get_derived_index(app_instance, ACL_RULES_FILENAME, build_rules_index)["users"].get(username_to_delete, ()):
+            path_rules = path_permissions.get(path, {})
+            if username_to_delete in path_rules.get("users",{}):
+                del path_rules["users"][username_to_delete]
+                rules_modified = True
+        if rules_modified:
+            pending_saves.append((ACL_RULES_FILENAME, acl_rules_data))
+
+    pending_saves.append((AUTH_USERS_FILENAME, auth_users_data))
+    failed = save_json_files(app_instance, pending_saves)
+    if not failed:
+        flash(f"User '{username_to_delete}' and their associated ACL entries deleted successfully.", "success")
+        app_instance.logger.info(f"AdminACLEditorPlugin: Admin deleted user '{username_to_delete}'.")
     else:
-        flash(f"User '{username_to_delete}' not found.", "error")
+        flash(f"Failed to fully delete user '{username_to_delete}': could not save {', '.join(failed)}.", "error")
         
     return redirect(url_for('.manage_users'))
 
@@ -3,42 +3,129 @@
 import os
 import re
 import json
-from flask import request, render_template, redirect, url_for, session, flash, g, Blueprint, current_app
+import tempfile
+from flask import request, render_template, redirect, url_for, session, flash, g, Blueprint
 from flask_mail import Message
 from werkzeug.security import generate_password_hash, check_password_hash
 import secrets # For generating secure tokens
+import hmac
+import hashlib
+import time
 from datetime import datetime, timedelta
 
 # --- Configuration ---
 USERS_FILENAME = "auth_users.json" # User data file
 AUTH_BLUEPRINT_NAME = 'auth_plugin'
-DEFAULT_HASH_METHOD = 'pbkdf2:sha256' 
+# Iteration count pinned at werkzeug 3.1's default (requirements: Werkzeug>=3.1.3) so a future
+# werkzeug release can't silently change the cost. Existing hashes carry their own method and still verify.
+DEFAULT_HASH_METHOD = 'pbkdf2:sha256:1000000'
 TOKEN_EXPIRATION_HOURS = 24 # For verification and password reset tokens
+# How long a successful password check is remembered, in seconds, and how many are kept
+LOGIN_CACHE_TTL = 60
+LOGIN_CACHE_SIZE = 1024
+EMAIL_RE = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+# At least 8 characters, including an uppercase letter and a numeral
+PASSWORD_MIN_LENGTH = 8
+# Longer passwords are refused before any hashing, so one request can't buy a huge PBKDF2 run
+PASSWORD_MAX_BYTES = 1024
 
 # --- User Data Management ---
 def get_users_file_path(app_instance):
-    data_dir = app_instance.config.get('DATA_DIR', os.path.join(app_instance.root_path, 'data'))
-    return os.path.join(data_dir, USERS_FILENAME)
+    users_file = app_instance.config.get('_AUTH_USERS_PATH') # Set once in register()
+    if users_file is None:
+        data_dir = app_instance.config.get('DATA_DIR', os.path.join(app_instance.root_path, 'data'))
+        users_file = os.path.join(data_dir, USERS_FILENAME)
+    return users_file
+
+# Parsed users file keyed by path -> (st_mtime_ns, st_size, users); re-read only when the file changes.
+_USERS_CACHE = {}
+
+def _copy_users(users):
+    # User records are flat dicts, so copying each record is a full (and cheap) copy.
+    return {username: dict(data) for username, data in users.items()}
 
 def load_users(app_instance):
+    """Returns a copy of the users the caller may modify and pass to save_users()."""
     users_file = get_users_file_path(app_instance)
-    if os.path.exists(users_file):
+    try:
+        st = os.stat(users_file)
+    except OSError:
+        return {}
+    cached = _USERS_CACHE.get(users_file)
+    if cached is None or cached[0] != st.st_mtime_ns or cached[1] != st.st_size:
         try:
             with open(users_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+                users = json.load(f)
         except Exception as e:
             app_instance.logger.error(f"AuthPlugin: Error loading users file {users_file}: {e}")
             return {} 
-    return {} 
+        cached = _USERS_CACHE[users_file] = (st.st_mtime_ns, st.st_size, users)
+    return _copy_users(cached[2])
+
+# Lookup tables built from the cached users: users_file -> (users they were built from, indexes).
+_USER_INDEXES = {}
+EMPTY_USER_INDEXES = {"by_email": {}, "by_verify_token": {}, "by_reset_token": {}}
+
+def build_user_indexes(users):
+    indexes = {"by_email": {}, "by_verify_token": {}, "by_reset_token": {}}
+    for username, data in users.items():
+        if data.get("email"):
+            indexes["by_email"].setdefault(data["email"], username)
+        if data.get("verification_token"):
+            indexes["by_verify_token"].setdefault(data["verification_token"], username)
+        if data.get("password_reset_token"):
+            indexes["by_reset_token"].setdefault(data["password_reset_token"], username)
+    return indexes
+
+def get_user_indexes(app_instance):
+    """Call after load_users(); returns the email/token -> username tables for the cached users."""
+    users_file = get_users_file_path(app_instance)
+    cached = _USERS_CACHE.get(users_file)
+    if cached is None:
+        return EMPTY_USER_INDEXES
+    entry = _USER_INDEXES.get(users_file)
+    if entry is None or entry[0] is not cached[2]:
+        entry = _USER_INDEXES[users_file] = (cached[2], build_user_indexes(cached[2]))
+    return entry[1]
+
+def encode_users(users_data):
+    """The one serialization of the users file; admin_acl_editor_plugin writes it with this too."""
+    return json.dumps(users_data, indent=4, ensure_ascii=False).encode('utf-8')
 
 def save_users(app_instance, users_data):
+    """
+    Writes users_data atomically (temp file, fsync, rename), so a crash mid-write never leaves
+    a truncated users file. Skipped when users_data equals what is already on disk.
+    """
     users_file = get_users_file_path(app_instance)
+    cached = _USERS_CACHE.get(users_file)
+    if cached is not None and cached[2] == users_data:
+        try:
+            st = os.stat(users_file)
+            if (st.st_mtime_ns, st.st_size) == cached[:2]:
+                return
+        except OSError:
+            pass
+    tmp_path = None
     try:
-        with open(users_file, 'w', encoding='utf-8') as f:
-            json.dump(users_data, f, indent=4, ensure_ascii=False)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(users_file), prefix='.' + USERS_FILENAME + '.', suffix='.tmp')
+        os.fchmod(fd, 0o644) # mkstemp creates 0600; keep the mode a plain open() would give
+        with os.fdopen(fd, 'wb') as f:
+            f.write(encode_users(users_data))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, users_file)
+        tmp_path = None
+        st = os.stat(users_file)
+        _USERS_CACHE[users_file] = (st.st_mtime_ns, st.st_size, _copy_users(users_data))
         app_instance.logger.info(f"AuthPlugin: User data saved to {users_file}")
     except Exception as e:
+        _USERS_CACHE.pop(users_file, None)
         app_instance.logger.error(f"AuthPlugin: Error saving users file {users_file}: {e}")
+    finally:
+        if tmp_path is not None:
+            try: os.unlink(tmp_path)
+            except OSError: pass
 
 def generate_token():
     return secrets.token_urlsafe(32)
@@ -129,29 +216,47 @@ def send_password_reset_email(app_instance, email, username, token):
     send_email(app_instance, subject, [email], text_body) #, html_body=html_body)
 # ------------------------------------------
 
-def check_password(password):
-    if len(password) < 8:
+# HMAC(secret key, username:password) -> (expiry, password_hash it was verified against).
+# Lets repeated logins within LOGIN_CACHE_TTL skip the full PBKDF2 run; neither the password
+# nor an unkeyed hash of it is kept.
+_LOGIN_CACHE = {}
+
+def verify_user_password(app_instance, username, user_data, password):
+    """check_password_hash() for a login, remembering recent successes for LOGIN_CACHE_TTL."""
+    password_hash = user_data.get("password_hash", "")
+    secret_key = app_instance.secret_key
+    if not secret_key or not password_hash:
+        return check_password_hash(password_hash, password)
+    if isinstance(secret_key, str): secret_key = secret_key.encode('utf-8')
+    key = hmac.new(secret_key, f"{username}:{password}".encode('utf-8'), hashlib.sha256).digest()
+    now = time.monotonic()
+    cached = _LOGIN_CACHE.get(key)
+    # A changed password_hash (reset, admin edit) means the cached success no longer applies.
+    if cached is not None and cached[0] > now and hmac.compare_digest(cached[1], password_hash):
+        return True
+    if not check_password_hash(password_hash, password):
         return False
+    if len(_LOGIN_CACHE) >= LOGIN_CACHE_SIZE:
+        _LOGIN_CACHE.clear()
+    _LOGIN_CACHE[key] = (now + LOGIN_CACHE_TTL, password_hash)
+    return True
+
+def password_too_long(password):
+    # A character is 1 to 4 bytes of UTF-8, so only lengths between those bounds need the encode
+    length = len(password)
+    if length > PASSWORD_MAX_BYTES: return True
+    if length * 4 <= PASSWORD_MAX_BYTES: return False
+    return len(password.encode('utf-8')) > PASSWORD_MAX_BYTES
 
-    has_uppercase = False
-    has_number = False
-
-    for c in password:
-        if not has_uppercase and c.isupper():
-            if has_number:
-                return True
-            has_uppercase = True
-        elif not has_number and c.isdigit():
-            if has_uppercase:
-                return True
-            has_number = True
-
-    return False
+def check_password(password):
+    if len(password) < PASSWORD_MIN_LENGTH or password_too_long(password):
+        return False
+    return any(c.isupper() for c in password) and any(c.isdigit() for c in password)
 
 # --- Routes ---
 @auth_bp.route('/register', methods=['GET', 'POST'])
 def register_route():
-    app_instance = getattr(g, 'app', current_app._get_current_object())
+    app_instance = g.app
     if request.method == 'POST':
         username = request.form.get('username', '').strip()
         email = request.form.get('email', '').strip().lower()
@@ -165,12 +270,12 @@ def register_route():
             flash("Username must consist of only letters and numbers.", "error")
             return render_template('register.html', title="Register", username='', email='')
 
-        if not re.match(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$', email): 
+        if not EMAIL_RE.match(email): 
             flash("Invalid email.", "error")
             return render_template('register.html', title="Register", username='', email='')
 
         if not check_password(password):
-            flash("Password must contain at least one uppercase letter and one numeral and be at least 8 characters long.", "error")
+            flash(f"Password must contain at least one uppercase letter and one numeral and be between 8 characters and {PASSWORD_MAX_BYTES} bytes long.", "error")
             return render_template('register.html', title="Register", username=username, email=email)
            
         
@@ -179,10 +284,9 @@ def register_route():
             flash("Username already exists. Please choose another.", "error")
             return render_template('register.html', title="Register", username=username, email=email)
         
-        for u_data in users.values(): # Check if email is already in use
-            if u_data.get('email') == email:
-                flash("Email address already registered. Please use a different email or try logging in.", "error")
-                return render_template('register.html', title="Register", username=username, email=email)
+        if email in get_user_indexes(app_instance)["by_email"]: # Check if email is already in use
+            flash("Email address already registered. Please use a different email or try logging in.", "error")
+            return render_template('register.html', title="Register", username=username, email=email)
 
         verification_token = generate_token()
         users[username] = {
@@ -205,16 +309,10 @@ def register_route():
 
 @auth_bp.route('/verify-email/<token>')
 def verify_email_route(token):
-    app_instance = getattr(g, 'app', current_app._get_current_object())
+    app_instance = g.app
     users = load_users(app_instance)
-    user_to_verify = None
-    username_verified = None
-
-    for username, data in users.items():
-        if data.get("verification_token") == token:
-            user_to_verify = data
-            username_verified = username
-            break
+    username_verified = get_user_indexes(app_instance)["by_verify_token"].get(token)
+    user_to_verify = users.get(username_verified)
     
     if user_to_verify:
         expiry_str = user_to_verify.get("verification_token_expiry")
@@ -237,7 +335,7 @@ def verify_email_route(token):
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
 def login_route():
-    app_instance = getattr(g, 'app', current_app._get_current_object())
+    app_instance = g.app
     if request.method == 'POST':
         username = request.form.get('username', '').strip()
         password = request.form.get('password', '')
@@ -246,10 +344,14 @@ def login_route():
             flash("Username and password are required.", "error")
             return render_template('login.html', title="Login")
 
+        if password_too_long(password):
+            flash("Invalid username or password.", "error")
+            return render_template('login.html', title="Login", username=username)
+
         users = load_users(app_instance)
         user_data = users.get(username)
 
-        if user_data and check_password_hash(user_data.get("password_hash", ""), password):
+        if user_data and verify_user_password(app_instance, username, user_data, password):
             if not user_data.get("is_verified", False):
                 flash("Your account is not verified. Please check your email for the verification link.", "warning")
                 return render_template('login.html', title="Login", username=username)
@@ -267,7 +369,7 @@ def login_route():
 
 @auth_bp.route('/logout')
 def logout_route():
-    app_instance = getattr(g, 'app', current_app._get_current_object())
+    app_instance = g.app
     username = session.pop('current_user', None)
     if username:
         flash("You have been logged out.", "success")
@@ -276,7 +378,7 @@ def logout_route():
 
 @auth_bp.route('/request-password-reset', methods=['GET', 'POST'])
 def request_password_reset_route():
-    app_instance = getattr(g, 'app', current_app._get_current_object())
+    app_instance = g.app
     if request.method == 'POST':
         email = request.form.get('email', '').strip().lower()
         if not email:
@@ -284,13 +386,10 @@ def request_password_reset_route():
             return render_template('request_password_reset.html', title="Request Password Reset")
 
         users = load_users(app_instance)
-        user_found = None
-        username_for_reset = None
-        for username, data in users.items():
-            if data.get('email') == email and data.get('is_verified'): # Only for verified users
-                user_found = data
-                username_for_reset = username
-                break
+        username_for_reset = get_user_indexes(app_instance)["by_email"].get(email)
+        user_found = users.get(username_for_reset)
+        if user_found and not user_found.get('is_verified'): # Only for verified users
+            user_found = None
         
         if user_found:
             reset_token = generate_token()
@@ -311,16 +410,10 @@ def request_password_reset_route():
 
 @auth_bp.route('/reset-password/<token>', methods=['GET', 'POST'])
 def reset_password_with_token_route(token):
-    app_instance = getattr(g, 'app', current_app._get_current_object())
+    app_instance = g.app
     users = load_users(app_instance)
-    user_to_reset = None
-    username_for_reset = None
-
-    for username, data in users.items():
-        if data.get("password_reset_token") == token:
-            user_to_reset = data
-            username_for_reset = username
-            break
+    username_for_reset = get_user_indexes(app_instance)["by_reset_token"].get(token)
+    user_to_reset = users.get(username_for_reset)
     
     if not user_to_reset:
         flash("Invalid or expired password reset token.", "error")
@@ -346,7 +439,7 @@ def reset_password_with_token_route(token):
             flash("Passwords do not match.", "error")
             return render_template('reset_password_form.html', title="Reset Password", token=token)
         if not check_password(new_password):
-            flash("Password must contain at least one uppercase letter and one numeral and be at least 8 characters long.", "error")
+            flash(f"Password must contain at least one uppercase letter and one numeral and be between 8 characters and {PASSWORD_MAX_BYTES} bytes long.", "error")
             return render_template('reset_password_form.html', title="Reset Password", token=token)
 
         user_to_reset["password_hash"] = generate_password_hash(new_password, method=DEFAULT_HASH_METHOD)
@@ -377,6 +470,7 @@ def inject_user_to_templates():
 
 # --- Plugin Registration Function ---
 def register(app_instance, register_hook_func):
+    app_instance.config['_AUTH_USERS_PATH'] = get_users_file_path(app_instance)
     auth_bp.before_request(before_request_handler(app_instance))
     app_instance.register_blueprint(auth_bp, url_prefix='/auth')
     app_instance.context_processor(inject_user_to_templates)
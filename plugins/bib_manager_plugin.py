@@ -2,6 +2,7 @@
 
 import os
 import json
+import shutil
 from flask import (
     Blueprint, render_template, request, redirect, url_for,
     flash, g, current_app, session, abort
@@ -32,6 +33,7 @@ except ImportError as e:
 # --- Configuration ---
 BIB_MANAGER_BLUEPRINT_NAME = 'bib_manager_plugin'
 ALLOWED_EXTENSIONS = {'bib', 'json', 'yaml', 'yml'}
+UPLOAD_COPY_BUFSIZE = 1 << 20 # Used when an upload can't be moved with sendfile()
 
 # --- Blueprint Definition ---
 bib_manager_bp = Blueprint(
@@ -43,13 +45,66 @@ bib_manager_bp = Blueprint(
 
 # --- Helper Functions ---
 def get_bibliographies_dir(app_instance):
-    # Ensure BIB_DIR is correctly fetched from config, with a sensible default
-    return app_instance.config.get('BIB_DIR', os.path.join(app_instance.root_path, 'data', 'bibliographies'))
+    bib_dir = app_instance.config.get('_BIB_DIR') # Set once in register()
+    if bib_dir is None:
+        # Ensure BIB_DIR is correctly fetched from config, with a sensible default
+        bib_dir = app_instance.config.get('BIB_DIR', os.path.join(app_instance.root_path, 'data', 'bibliographies'))
+    return bib_dir
 
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+# Sorted listing of each bibliographies directory: bib_dir -> (st_mtime_ns, file names).
+# Adding or removing a file changes the directory's mtime; upload/delete also drop the entry
+# in case the change lands within the filesystem's mtime granularity.
+_BIB_LISTING_CACHE = {}
+
+def list_bibliography_files(bib_dir):
+    try:
+        mtime_ns = os.stat(bib_dir).st_mtime_ns
+    except FileNotFoundError:
+        return []
+    cached = _BIB_LISTING_CACHE.get(bib_dir)
+    if cached is not None and cached[0] == mtime_ns:
+        return cached[1]
+    # DirEntry.is_file() uses the type from the directory read, so no stat() per file
+    with os.scandir(bib_dir) as entries:
+        names = sorted(entry.name for entry in entries if allowed_file(entry.name) and entry.is_file())
+    _BIB_LISTING_CACHE[bib_dir] = (mtime_ns, names)
+    return names
+
+def save_uploaded_file(file_storage, upload_path):
+    """
+    Like FileStorage.save(), but uploads werkzeug has spooled to disk are copied by the kernel
+    with sendfile(), and ones still in memory with a 1 MiB buffer instead of 16 KiB.
+    """
+    src = file_storage.stream
+    with open(upload_path, 'wb') as dst:
+        # werkzeug's SpooledTemporaryFile keeps uploads under 500 KiB in memory; calling
+        # fileno() on it would force them out to a temp file first.
+        in_memory = not getattr(src, '_rolled', True)
+        try:
+            if in_memory or not hasattr(os, 'sendfile'):
+                raise OSError
+            in_fd = src.fileno()
+            start = offset = src.tell()
+            size = os.fstat(in_fd).st_size
+        except (AttributeError, OSError, ValueError): # In memory (BytesIO or unrolled), or no sendfile here
+            shutil.copyfileobj(src, dst, UPLOAD_COPY_BUFSIZE)
+            return
+        try:
+            while offset < size:
+                sent = os.sendfile(dst.fileno(), in_fd, offset, size - offset)
+                if sent == 0:
+                    break
+                offset += sent
+        except OSError: # e.g. a filesystem that doesn't support it; start over in userspace
+            dst.seek(0)
+            dst.truncate()
+            src.seek(start)
+            shutil.copyfileobj(src, dst, UPLOAD_COPY_BUFSIZE)
+
 # --- Route Protection Helper ---
 def admin_required_for_bib_manager(f):
     @wraps(f)
@@ -112,7 +167,8 @@ def manage_bibliographies():
                 flash(f"File '{filename}' already exists. Please rename or delete the existing file first.", "warning")
             else:
                 try:
-                    file.save(upload_path)
+                    save_uploaded_file(file, upload_path)
+                    _BIB_LISTING_CACHE.pop(bib_dir, None)
                     flash(f"File '{filename}' uploaded successfully.", "success")
                     app_instance.logger.info(f"BibManagerPlugin: File '{filename}' uploaded to {bib_dir}")
                 except Exception as e:
@@ -124,17 +180,14 @@ def manage_bibliographies():
             return redirect(request.url)
 
     bib_files = []
-    if os.path.exists(bib_dir):
-        try:
-            for f_name in os.listdir(bib_dir):
-                if allowed_file(f_name) and os.path.isfile(os.path.join(bib_dir, f_name)): 
-                    bib_files.append(f_name)
-        except Exception as e:
-            app_instance.logger.error(f"BibManagerPlugin: Error listing files in {bib_dir}: {e}")
-            flash("Error listing bibliography files.", "error")
+    try:
+        bib_files = list_bibliography_files(bib_dir)
+    except Exception as e:
+        app_instance.logger.error(f"BibManagerPlugin: Error listing files in {bib_dir}: {e}")
+        flash("Error listing bibliography files.", "error")
 
     # Pass app_instance to the template context as 'app'
-    return render_template('manage_bibliographies.html', title="Manage Bibliography Files", files=sorted(bib_files), app=app_instance)
+    return render_template('manage_bibliographies.html', title="Manage Bibliography Files", files=bib_files, app=app_instance)
 
 @bib_manager_bp.route('/delete/<path:filename>', methods=['POST'])
 @admin_required_for_bib_manager
@@ -150,9 +203,10 @@ def delete_bibliography_file(filename):
 
     file_path = os.path.join(bib_dir, safe_filename)
 
-    if os.path.exists(file_path) and os.path.isfile(file_path):
+    if os.path.isfile(file_path):
         try:
             os.remove(file_path)
+            _BIB_LISTING_CACHE.pop(bib_dir, None)
             flash(f"File '{safe_filename}' deleted successfully.", "success")
             app_instance.logger.info(f"BibManagerPlugin: Deleted file '{file_path}'")
         except Exception as e:
@@ -167,6 +221,8 @@ def delete_bibliography_file(filename):
 
 # --- Plugin Registration ---
 def register(app_instance, register_hook_func): 
+    app_instance.config['_BIB_DIR'] = get_bibliographies_dir(app_instance)
+
     @app_instance.before_request 
     def bib_manager_before_request_setup(): 
         if request.blueprint == BIB_MANAGER_BLUEPRINT_NAME: 
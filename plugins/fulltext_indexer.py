@@ -5,8 +5,8 @@ import json
 import re
 import math # For TF-IDF calculation (log)
 from collections import Counter
-import frontmatter # To parse frontmatter from page content
-import pypandoc # For converting Markdown to plain text
+# frontmatter and pypandoc are only needed when running without the main app's helpers,
+# so they are imported on first use rather than at startup.
 # from flask import current_app # For potential direct app context if needed outside hooks
 
 # --- Configuration ---
@@ -15,6 +15,7 @@ PAGE_META_FILENAME = "indexer_page_meta.json"
 VOCABULARY_FILENAME = "indexer_vocabulary.json"
 INVERTED_INDEX_FILENAME = "indexer_inverted_index.json"
 TFIDF_VECTORS_FILENAME = "indexer_tfidf_vectors.json" 
+WORD_RE = re.compile(r'\b\w+\b') # Tokenizer; search_plugin.py uses the same pattern for queries
 
 # --- Helper Functions for Data File Management ---
 
@@ -94,9 +95,22 @@ def get_or_create_word_id(app_instance, word):
 
 # --- Text Processing ---
 
+def extract_markdown_body(app_instance, raw_page_content):
+    """Strips the frontmatter from a page. The main app's splitter skips parsing the YAML, which indexing never uses."""
+    split_frontmatter = getattr(app_instance, 'split_frontmatter', None)
+    if split_frontmatter is not None:
+        return split_frontmatter(raw_page_content)[1]
+    import frontmatter
+    return frontmatter.loads(raw_page_content).content
+
 def extract_text_from_markdown(app_instance, markdown_content):
     """Converts Markdown to plain text using Pandoc."""
     try:
+        # The main app's converter goes through the pandoc server when one is configured.
+        pandoc_convert = getattr(app_instance, 'pandoc_convert', None)
+        if pandoc_convert is not None:
+            return pandoc_convert(markdown_content, 'plain', format='markdown')
+        import pypandoc
         plain_text = pypandoc.convert_text(markdown_content, 'plain', format='markdown')
         return plain_text
     except Exception as e:
@@ -107,7 +121,7 @@ def tokenize_and_normalize(text_content):
     """Tokenizes text, converts to lowercase."""
     if not text_content:
         return []
-    words = re.findall(r'\b\w+\b', text_content.lower())
+    words = WORD_RE.findall(text_content.lower())
     return words
 
 # --- Indexing Logic ---
@@ -248,8 +262,7 @@ def recalculate_all_tfidf_vectors(app_instance, trigger_hook_func=None):
             with open(page_file_path, 'r', encoding='utf-8') as f:
                 raw_page_content = f.read()
             
-            article = frontmatter.loads(raw_page_content)
-            markdown_body = article.content
+            markdown_body = extract_markdown_body(app_instance, raw_page_content)
             plain_text_body = extract_text_from_markdown(app_instance, markdown_body)
             tokens = tokenize_and_normalize(plain_text_body)
             term_frequencies_for_page = Counter(tokens)
@@ -305,8 +318,7 @@ def index_page_on_save(page_name_slug, file_path, app_context):
         with open(file_path, 'r', encoding='utf-8') as f:
             raw_page_content = f.read()
         
-        article = frontmatter.loads(raw_page_content)
-        markdown_body = article.content
+        markdown_body = extract_markdown_body(app_context, raw_page_content)
         
         plain_text_body = extract_text_from_markdown(app_context, markdown_body)
         tokens = tokenize_and_normalize(plain_text_body)
@@ -28,6 +28,10 @@ except ImportError as e:
 MEDIA_MANAGER_BLUEPRINT_NAME = 'media_manager_plugin'
 # MEDIA_DIR and ALLOWED_MEDIA_EXTENSIONS will be taken from app.config
 
+# Regex for ![alt](path "title") or ![alt](path)
+# Group 1: Alt text. Group 2: Path. Group 3: Optional title part (e.g. " \"My Title\"")
+MARKDOWN_IMAGE_RE = re.compile(r'!\[(.*?)\]\((.*?)(?:\s+(".*?"|\'.*?\'))?\)')
+
 # --- Blueprint Definition ---
 media_manager_bp = Blueprint(
     MEDIA_MANAGER_BLUEPRINT_NAME,
@@ -145,7 +149,7 @@ def delete_media_file_admin(filename): # Renamed to avoid conflict with potentia
 
     file_path = os.path.join(media_dir, safe_filename)
 
-    if os.path.exists(file_path) and os.path.isfile(file_path):
+    if os.path.isfile(file_path):
         try:
             os.remove(file_path)
             flash(f"File '{safe_filename}' deleted successfully.", "success")
@@ -212,11 +216,7 @@ def process_media_links_hook(markdown_content, current_page_slug, app_context):
                 return match.group(0) # Return original match on error
         return match.group(0) # Return original if it looks like a full URL or absolute path
 
-    # Regex for ![alt](path "title") or ![alt](path)
-    # Group 1: Alt text. Group 2: Path. Group 3: Optional title part (e.g. " \"My Title\"")
-    markdown_image_pattern = r'!\[(.*?)\]\((.*?)(?:\s+(".*?"|\'.*?\'))?\)'
-    
-    new_content = re.sub(markdown_image_pattern, replace_link, markdown_content)
+    new_content = MARKDOWN_IMAGE_RE.sub(replace_link, markdown_content)
     return new_content
 
 
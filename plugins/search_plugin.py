@@ -5,12 +5,12 @@ import json
 import re
 from collections import defaultdict, Counter
 from flask import request, render_template, url_for, current_app
-import frontmatter
 
 # --- Configuration (relative to the indexer plugin's filenames) ---
 PAGE_META_FILENAME = "indexer_page_meta.json"
 VOCABULARY_FILENAME = "indexer_vocabulary.json"
 INVERTED_INDEX_FILENAME = "indexer_inverted_index.json"
+WORD_RE = re.compile(r'\b\w+\b') # Must match the indexer's tokenizer
 
 # --- Helper Functions ---
 
@@ -37,7 +37,7 @@ def tokenize_and_normalize_query(query_string):
     """Tokenizes and normalizes a search query string."""
     if not query_string:
         return []
-    return re.findall(r'\b\w+\b', query_string.lower())
+    return WORD_RE.findall(query_string.lower())
 
 # --- Search Logic ---
 
@@ -85,9 +85,14 @@ def perform_search(app_instance, query_string):
             try:
                 page_file_path = os.path.join(app_instance.config['PAGES_DIR'], slug + '.md')
                 if os.path.exists(page_file_path):
-                    with open(page_file_path, 'r', encoding='utf-8') as f:
-                        article_fm = frontmatter.load(f)
-                        page_title = article_fm.metadata.get('title', page_title)
+                    load_page_source = getattr(app_instance, 'load_page_source', None)
+                    if load_page_source is not None: # libyaml-backed parser from the main app
+                        page_title = load_page_source(page_file_path)[0].get('title', page_title)
+                    else:
+                        import frontmatter # Only needed without the main app's parser
+                        with open(page_file_path, 'r', encoding='utf-8') as f:
+                            article_fm = frontmatter.load(f)
+                            page_title = article_fm.metadata.get('title', page_title)
             except Exception as e:
                 app_instance.logger.warning(f"SearchPlugin: Could not read title for page {slug}: {e}")
             
@@ -13,6 +13,9 @@ PAGE_META_FILENAME = "indexer_page_meta.json"
 TFIDF_VECTORS_FILENAME = "indexer_tfidf_vectors.json"
 # VOCABULARY_FILENAME = "indexer_vocabulary.json" # Not directly needed for this version
 
+# Finds ~~SIMILAR~~ or ~~SIMILAR(N)~~, capturing the optional number N.
+SIMILAR_MACRO_RE = re.compile(r'~~\s*SIMILAR(?:\s*\((\d+)\))?\s*~~')
+
 # --- Helper Functions ---
 def get_data_file_path(app_instance, filename):
     data_dir = app_instance.config.get('DATA_DIR', os.path.join(app_instance.root_path, 'data'))
@@ -120,10 +123,6 @@ def process_similar_macro_hook(markdown_content, current_page_slug, app_context)
     """
     app_context.logger.debug(f"SimilarPagesPlugin (HOOK: process_page_macros) for page '{current_page_slug}'")
 
-    # Regex to find ~~SIMILAR~~ or ~~SIMILAR(N)~~
-    # It captures the optional number N.
-    macro_pattern = r'~~\s*SIMILAR(?:\s*\((\d+)\))?\s*~~'
-
     def replace_macro(match):
         num_similar_str = match.group(1)
         num_similar = 5 # Default
@@ -139,7 +138,7 @@ def process_similar_macro_hook(markdown_content, current_page_slug, app_context)
 
     # Perform the substitution
     # We use a function for re.sub to handle multiple occurrences correctly
-    new_content, num_replacements = re.subn(macro_pattern, replace_macro, markdown_content)
+    new_content, num_replacements = SIMILAR_MACRO_RE.subn(replace_macro, markdown_content)
     
     if num_replacements > 0:
         app_context.logger.info(f"SimilarPagesPlugin: Replaced {num_replacements} SIMILAR macro(s) on page '{current_page_slug}'.")
@@ -2,14 +2,13 @@
 
 import os
 import re
-import yaml
-import frontmatter
 import subprocess
 from flask import Blueprint, send_from_directory, current_app, url_for, abort
 from werkzeug.utils import safe_join
 
 # --- Configuration ---
 SLIDESHOW_BLUEPRINT_NAME = 'slideshow_plugin'
+SLIDE_BREAK_RE = re.compile(r'\n(## .*)') # Every H2 starts a new slide
 
 # --- Blueprint ---
 slideshow_bp = Blueprint(SLIDESHOW_BLUEPRINT_NAME, __name__)
@@ -46,6 +45,7 @@ def generate_slideshow(page_name, **kwargs):
 
     try:
         with open(source_file_path, 'r', encoding='utf-8') as f:
+            import frontmatter # Only slideshow generation needs it; imported on first use
             article = frontmatter.load(f)
 
         article.content = article.content.replace('~~SLIDESHOW~~', '')
@@ -80,7 +80,7 @@ section pre, section code, section kbd, section samp {
         full_document_string = frontmatter.dumps(article)
         
         # Insert slide dividers before every H2 for automatic slide breaks.
-        final_markdown = re.sub(r'\n(## .*)', r'\n\n---\n\n\1', full_document_string)
+        final_markdown = SLIDE_BREAK_RE.sub(r'\n\n---\n\n\1', full_document_string)
         
         env = os.environ.copy()
         env['CHROME_NO_SANDBOX'] = 'true'